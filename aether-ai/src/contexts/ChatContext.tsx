@@ -86,7 +86,8 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
 
   const fetchConversations = useCallback(async () => {
     try {
-      const response = await fetch('/api/conversations');
+      // First page of summaries (most recently updated first); messages load with the conversation
+      const response = await fetch('/api/conversations?limit=50');
       if (response.ok) {
         const data = await response.json();
         // Map backend response to frontend types
@@ -94,17 +95,11 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
         const mappedConversations: Conversation[] = backendConversations.map((c: any) => ({
           id: c.conversation_id, // Map conversation_id to id
           title: c.title || 'New Conversation',
-          date: new Date(c.created_at || c.updated_at || Date.now()),
-          messages: (c.messages || []).map((m: any) => ({
-            id: crypto.randomUUID(), // Generate ID for message
-            role: m.role,
-            content: m.content,
-            timestamp: new Date(m.timestamp),
-          })),
+          createdAt: new Date(c.created_at),
+          updatedAt: new Date(c.updated_at),
+          date: new Date(c.updated_at || c.created_at || Date.now()),
+          messages: [],
         }));
-
-        // Sort by date desc
-        mappedConversations.sort((a, b) => b.date.getTime() - a.date.getTime());
         setConversations(mappedConversations);
       }
     } catch (error) {
@@ -166,7 +161,7 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
     }
 
     try {
-      const response = await fetch('/api/chat', {
+      const response = await fetch('/api/chat/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -181,18 +176,52 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
         }),
       });
 
-      if (response.ok) {
-        const data = await response.json();
-        const assistantMessage: ChatMessage = {
-          id: crypto.randomUUID(),
-          role: 'assistant',
-          content: data.message,
-          timestamp: new Date(),
-          sources: data.sources,
-          toolsUsed: data.tools_used,
-          imageUrl: data.image_url,
-        };
-        setMessages((prev) => [...prev, assistantMessage]);
+      if (response.ok && response.body) {
+        // Server-Sent Events: render the answer as tokens arrive
+        const assistantId = crypto.randomUUID();
+        const updateAssistant = (patch: Partial<ChatMessage>) =>
+          setMessages((prev) => prev.map((m) => (m.id === assistantId ? { ...m, ...patch } : m)));
+        setMessages((prev) => [
+          ...prev,
+          { id: assistantId, role: 'assistant', content: '', timestamp: new Date() },
+        ]);
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let content = '';
+
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+
+          const events = buffer.split('\n\n');
+          buffer = events.pop() || '';
+          for (const raw of events) {
+            const event = raw.match(/^event: (.*)$/m)?.[1];
+            const dataLine = raw.match(/^data: (.*)$/m)?.[1];
+            if (!event || !dataLine) continue;
+            const data = JSON.parse(dataLine);
+
+            if (event === 'token') {
+              if (!content) setIsTyping(false);
+              content += data.text;
+              updateAssistant({ content });
+            } else if (event === 'sources') {
+              updateAssistant({ sources: data.sources, imageUrl: data.image_url });
+            } else if (event === 'done') {
+              updateAssistant({
+                content: data.message,
+                sources: data.sources,
+                toolsUsed: data.tools_used,
+                imageUrl: data.image_url,
+              });
+            } else if (event === 'error') {
+              updateAssistant({ content: `⚠️ Error: ${data.detail || 'Failed to get response from AI.'}` });
+            }
+          }
+        }
 
         // Refresh conversations
         fetchConversations();
@@ -244,7 +273,26 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({ children
         throw new Error('Upload failed');
       }
 
-      const data = await response.json();
+      let data = await response.json();
+
+      // Documents are ingested in the background; poll the job until it finishes
+      if (data.job_id) {
+        while (true) {
+          await new Promise((resolve) => setTimeout(resolve, 1000));
+          const jobResponse = await fetch(`/api/upload/jobs/${data.job_id}`);
+          if (!jobResponse.ok) {
+            throw new Error('Upload job lost');
+          }
+          const job = await jobResponse.json();
+          if (job.status === 'completed') {
+            data = { ...data, status: 'success', text_length: job.text_length };
+            break;
+          }
+          if (job.status === 'failed' || job.status === 'cancelled') {
+            throw new Error(job.error || `Upload ${job.status}`);
+          }
+        }
+      }
 
       // Auto-enable RAG when doc uploaded
       setUseRag(true);
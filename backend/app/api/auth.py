@@ -29,7 +29,7 @@ async def signup(request: SignupRequest):
         )
     
     # Check if user already exists
-    existing_user = supabase.table("users").select("id").eq("email", request.email).execute()
+    existing_user = await supabase.table("users").select("id").eq("email", request.email)
     if existing_user.data:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -41,7 +41,7 @@ async def signup(request: SignupRequest):
     
     # Create user in database
     try:
-        result = supabase.table("users").insert({
+        result = await supabase.table("users").ainsert({
             "name": request.name,
             "email": request.email,
             "password_hash": password_hash
@@ -87,7 +87,7 @@ async def login(request: LoginRequest):
     3. Generate JWT token
     """
     # Find user by email
-    result = supabase.table("users").select("*").eq("email", request.email).execute()
+    result = await supabase.table("users").select("*").eq("email", request.email)
     
     if not result.data:
         raise HTTPException(
@@ -1,33 +1,99 @@
 """
 Conversations API endpoints.
+
+Listings are paginated with opaque cursors: pass a response's next_cursor
+back as ?cursor= to get the next page.
 """
-from fastapi import APIRouter, HTTPException
-from app.schemas.conversation import Conversation, ConversationList
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+from fastapi import APIRouter, HTTPException, Query
+from app.schemas.conversation import Conversation, ConversationPage, MessagePage
 from app.storage.chat_history import chat_history_store
 
 router = APIRouter(prefix="/conversations", tags=["conversations"])
 
 
-@router.get("", response_model=ConversationList)
-async def get_conversations():
+def _encode_cursor(updated_at: datetime, conversation_id: str) -> str:
+    raw = f"{updated_at.isoformat()}|{conversation_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        updated_at, conversation_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(updated_at), conversation_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("", response_model=ConversationPage)
+async def get_conversations(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None
+):
     """
-    Get all conversations.
-    
+    List conversations, most recently updated first.
+
+    Args:
+        limit: Page size
+        cursor: next_cursor from the previous page
+
     Returns:
-        List of all conversations with their messages
+        Conversation summaries (no messages) and the cursor for the next page
     """
-    conversations = chat_history_store.get_all_conversations()
-    return ConversationList(conversations=conversations)
+    before = _decode_cursor(cursor) if cursor else None
+    # One extra summary tells whether another page exists
+    summaries = chat_history_store.list_conversations(limit + 1, before)
+    next_cursor = None
+    if len(summaries) > limit:
+        summaries = summaries[:limit]
+        next_cursor = _encode_cursor(summaries[-1].updated_at, summaries[-1].conversation_id)
+    return ConversationPage(conversations=summaries, next_cursor=next_cursor)
+
+
+@router.get("/{conversation_id}/messages", response_model=MessagePage)
+async def get_conversation_messages(
+    conversation_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None
+):
+    """
+    Page through a conversation's messages, newest page first.
+
+    Args:
+        conversation_id: Unique identifier for the conversation
+        limit: Page size
+        cursor: next_cursor from the previous page (older messages)
+
+    Returns:
+        Messages in chronological order and the cursor for older messages
+    """
+    before = None
+    if cursor:
+        if not cursor.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        before = int(cursor)
+
+    page = chat_history_store.get_message_page(conversation_id, limit, before)
+    if page is None:
+        raise HTTPException(status_code=404, detail=f"Conversation not found: {conversation_id}")
+    messages, start = page
+    return MessagePage(
+        conversation_id=conversation_id,
+        messages=messages,
+        next_cursor=str(start) if start > 0 else None
+    )
 
 
 @router.get("/{conversation_id}", response_model=Conversation)
 async def get_conversation(conversation_id: str):
     """
     Get a specific conversation by ID.
-    
+
     Args:
         conversation_id: Unique identifier for the conversation
-        
+
     Returns:
         Conversation with all messages
     """
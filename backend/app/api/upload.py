@@ -1,11 +1,14 @@
 """
 Document upload API with RAG processing and image support.
 """
+import asyncio
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
-from app.core.rag import process_document, create_vector_store
+from app.core.ingestion import ingestion_queue
+from app.schemas.upload import IngestionJobStatus
 from app.tools.vision_query import encode_image_to_base64
 from app.storage.chat_history import chat_history_store
+from app.storage.blob_store import blob_store
 
 router = APIRouter(tags=["upload"])
 
@@ -21,12 +24,15 @@ async def upload_document(
     """
     Upload a document (PDF/TXT) or image for RAG/vision processing.
     
+    Images are stored immediately. Documents are queued for background
+    ingestion; poll GET /upload/jobs/{job_id} for progress.
+    
     Args:
         file: PDF, TXT, or image file
         conversation_id: Conversation to associate with
         
     Returns:
-        Upload status
+        Upload status (with job_id for documents)
     """
     try:
         # Read file content
@@ -44,25 +50,27 @@ async def upload_document(
             # Handle image upload
             print(f"[Upload] Processing image {file.filename} ({len(content)} bytes)")
             
-            # Convert to base64
-            image_base64 = encode_image_to_base64(content)
             image_format = file_ext[1:]  # Remove the dot
             
-            # Store in memory
+            # Store the raw bytes once (identical uploads share a blob); history keeps a reference
+            blob_id = await asyncio.to_thread(blob_store.put, content)
             chat_history_store.add_image(
                 conversation_id=conversation_id,
-                image_base64=image_base64,
+                blob_id=blob_id,
                 filename=file.filename,
-                image_format=image_format
+                image_format=image_format,
+                size=len(content)
             )
             
+            # The browser preview is the only consumer of base64 here
             return JSONResponse({
                 "status": "success",
                 "message": f"Image '{file.filename}' uploaded successfully",
                 "filename": file.filename,
                 "type": "image",
                 "conversation_id": conversation_id,
-                "image_data": f"data:image/{image_format};base64,{image_base64}"
+                "blob_id": blob_id,
+                "image_data": f"data:image/{image_format};base64,{encode_image_to_base64(content)}"
             })
         
         # Handle text document upload
@@ -72,35 +80,23 @@ async def upload_document(
                 detail="Only PDF, TXT, and image files (jpg, png, gif, etc.) are supported"
             )
         
-        # Extract text
-        print(f"[Upload] Processing {file.filename} ({len(content)} bytes)")
-        text = process_document(content, file.filename)
-        
-        if not text or len(text.strip()) < 100:
+        # Queue extract -> chunk -> embed -> store in the background
+        try:
+            job = ingestion_queue.submit(conversation_id, file.filename, content)
+        except asyncio.QueueFull:
             raise HTTPException(
-                status_code=400,
-                detail="Could not extract sufficient text from document"
-            )
-        
-        print(f"[Upload] Extracted {len(text)} characters")
-        
-        # Create vector store
-        success = create_vector_store(conversation_id, text)
-        
-        if not success:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to create vector store"
+                status_code=503,
+                detail="Too many documents are being processed. Please try again shortly."
             )
         
         return JSONResponse({
-            "status": "success",
-            "message": f"Document '{file.filename}' processed successfully",
+            "status": "queued",
+            "message": f"Document '{file.filename}' queued for processing",
             "filename": file.filename,
             "type": "document",
-            "text_length": len(text),
+            "job_id": job.job_id,
             "conversation_id": conversation_id
-        })
+        }, status_code=202)
         
     except HTTPException:
         raise
@@ -112,3 +108,45 @@ async def upload_document(
             status_code=500,
             detail=f"Error processing file: {str(e)}"
         )
+
+
+@router.get("/upload/jobs/{job_id}", response_model=IngestionJobStatus)
+async def get_upload_job(job_id: str):
+    """
+    Get progress of a document ingestion job.
+    
+    Args:
+        job_id: ID returned by /upload
+        
+    Returns:
+        Job status with per-stage progress
+    """
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@router.delete("/upload/jobs/{job_id}", response_model=IngestionJobStatus)
+async def cancel_upload_job(job_id: str):
+    """
+    Cancel a queued or running ingestion job.
+    
+    Args:
+        job_id: ID returned by /upload
+        
+    Returns:
+        Job status after cancellation
+    """
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not ingestion_queue.cancel(job_id):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job cannot be cancelled (status: {job.status}, stage: {job.stage})"
+        )
+    # Give the running task a moment to unwind before reporting
+    if job._task is not None:
+        await asyncio.wait([job._task], timeout=1.0)
+    return job.to_dict()
@@ -0,0 +1,118 @@
+"""
+Cancel chat pipelines whose client has gone away.
+
+A request's event generator runs in its own task. While the endpoint waits
+for the next event it also polls the connection; once the client has
+disconnected (or the response is torn down by the server) the task is
+cancelled. The cancellation reaches every await in the pipeline, including
+context providers, queued and waiting tool calls, LLM requests and shared
+single-flight calls.
+"""
+import time
+import asyncio
+from typing import Any, AsyncIterator, Dict, Tuple
+
+from app.core.config import settings
+
+
+class ClientDisconnected(Exception):
+    """The client closed the connection before the response was complete."""
+
+
+class CancellationStats:
+    """Counts abandoned requests and the pipeline stage they were abandoned in."""
+
+    def __init__(self):
+        self.disconnects = 0
+        self.by_stage: Dict[str, int] = {}
+
+    def record(self, stage: str):
+        self.disconnects += 1
+        self.by_stage[stage] = self.by_stage.get(stage, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Disconnects plus the downstream work they cancelled."""
+        from app.core.direct_tool_executor import direct_executor
+        from app.core.llm_routing import model_health
+        from app.core.single_flight import single_flight
+        return {
+            "disconnects": self.disconnects,
+            "by_stage": dict(self.by_stage),
+            "cancelled": {
+                "llm_requests": model_health.cancelled,
+                "tool_calls": direct_executor.cancelled,
+                "shared_calls": single_flight.cancelled,
+            },
+        }
+
+
+# Global counters
+cancellation_stats = CancellationStats()
+
+
+async def _pump(events: AsyncIterator[Tuple[str, Dict[str, Any]]], queue: asyncio.Queue):
+    """Move events from the pipeline to the queue; the last item is ("end", error or None)."""
+    try:
+        async for item in events:
+            await queue.put(("event", item))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await queue.put(("end", e))
+        return
+    await queue.put(("end", None))
+
+
+async def cancel_on_disconnect(
+    http_request,
+    events: AsyncIterator[Tuple[str, Dict[str, Any]]],
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Re-yield a pipeline's events, cancelling the pipeline if the client disconnects.
+
+    Args:
+        http_request: Starlette request, polled with is_disconnected()
+        events: The pipeline's (event, data) generator
+
+    Raises:
+        ClientDisconnected: The client went away; the pipeline has been cancelled
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+    pipeline = asyncio.create_task(_pump(events, queue))
+    start = time.perf_counter()
+    stage = "context"
+    finished = False
+
+    try:
+        while True:
+            next_item = asyncio.ensure_future(queue.get())
+            while True:
+                done, _ = await asyncio.wait({next_item}, timeout=settings.disconnect_poll_interval)
+                if done:
+                    break
+                if await http_request.is_disconnected():
+                    next_item.cancel()
+                    raise ClientDisconnected()
+
+            kind, item = next_item.result()
+            if kind == "end":
+                finished = True
+                if item is not None:
+                    raise item
+                return
+
+            event, data = item
+            if event == "stage":
+                stage = data["stage"]
+            elif event == "done":
+                finished = True  # Nothing left to cancel once the response is complete
+            yield event, data
+    finally:
+        # Disconnect, server-side teardown of the response, or an early exit by the caller
+        if not pipeline.done():
+            pipeline.cancel()
+            await asyncio.gather(pipeline, return_exceptions=True)
+            if not finished:
+                elapsed = time.perf_counter() - start
+                cancellation_stats.record(stage)
+                print(f"[Chat] Client disconnected during {stage} after {elapsed:.1f}s, cancelled pending work")
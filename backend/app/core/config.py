@@ -30,6 +30,10 @@ class Settings(BaseSettings):
     # Supabase Database
     supabase_url: str
     supabase_key: str
+    supabase_insert_batch_size: int = 100  # Rows per bulk PostgREST insert
+    supabase_max_connections: int = 20  # Pooled connections to the Supabase REST API
+    supabase_max_keepalive_connections: int = 10
+    supabase_timeout: float = 10.0
 
     # JWT Authentication
     jwt_secret_key: str = "your-secret-key-change-in-production"
@@ -39,6 +43,86 @@ class Settings(BaseSettings):
     # Tavily Web Search
     tavily_api_key: Optional[str] = None
 
+    # Embeddings (OpenAI-compatible, via OpenRouter)
+    embedding_model: str = "openai/text-embedding-3-small"
+    embedding_batch_size: int = 128  # Max inputs per request
+    embedding_max_batch_tokens: int = 250_000  # Estimated tokens per request
+    embedding_max_batch_bytes: int = 2_000_000  # JSON payload guard
+    embedding_concurrency: int = 4  # Batches in flight at once
+    embedding_cache_size: int = 10_000  # Vectors kept in the in-process LRU
+    embedding_cache_path: Optional[str] = ".cache/embeddings.sqlite3"  # Empty disables disk tier
+
+    # In-process chat history (conversations beyond the limits spill to a per-worker SQLite file)
+    chat_history_max_conversations: int = 500  # Conversations kept in memory
+    chat_history_max_memory_mb: int = 256  # Approximate memory for messages and images
+    chat_history_spill_dir: Optional[str] = ".cache/chat_history"  # Empty disables spilling (evicted = dropped)
+
+    # Uploaded images (content-addressed raw bytes)
+    blob_store_path: str = ".cache/blobs"
+    blob_retention_hours: float = 24.0  # Unreferenced blobs are deleted after this long unused
+    blob_sweep_interval_seconds: float = 3600.0
+
+    # Document extraction
+    pdf_extract_workers: int = 0  # Process pool size (0 = min(4, CPU count))
+    pdf_pages_per_task: int = 8  # Pages extracted per worker task
+    pdf_page_window: int = 64  # Max pages in flight / buffered during extraction
+    rag_ingest_window: int = 64  # Chunks embedded and stored per step (rounded to whole sections)
+
+    # Background ingestion jobs (/api/upload)
+    ingestion_workers: int = 2  # Documents processed concurrently
+    ingestion_max_pending: int = 32  # Queued jobs before uploads are rejected
+    ingestion_job_ttl_seconds: int = 3600  # How long finished jobs stay pollable
+
+    # Hierarchical retrieval
+    rag_section_size: int = 8  # Chunks per section summary vector
+    rag_top_sections: int = 3  # Sections searched per query
+    rag_hybrid: bool = True  # Fuse BM25 keyword hits with vector hits (RRF)
+    rag_rrf_k: int = 60  # RRF damping constant
+    keyword_index_path: str = ".cache/keyword"
+
+    # Prompt context packing
+    context_token_budget: int = 6000  # Max tokens of RAG/web/vision context per prompt
+    context_min_snippet_tokens: int = 64  # Don't add snippets trimmed below this
+
+    # LLM client pool
+    llm_pool_size: int = 32  # Cached chat model clients
+    llm_pool_idle_seconds: float = 600.0  # Evict clients unused for this long
+
+    # Latency-aware model routing (hedged requests and fallback)
+    llm_routing: bool = True
+    llm_health_window: int = 50  # Recent requests kept per model
+    llm_hedge_min_samples: int = 10  # Samples before p95 is trusted as the hedge delay
+    llm_hedge_delay_seconds: float = 10.0  # Hedge delay until then
+    llm_hedge_min_delay_seconds: float = 1.0  # Never hedge sooner than this
+    llm_failure_threshold: int = 3  # Consecutive failures before a model is benched
+    llm_cooldown_seconds: float = 60.0  # How long a benched model stays out of rotation
+
+    # Semantic response cache (opt-in)
+    response_cache_enabled: bool = False
+    response_cache_size: int = 1000  # Max cached responses (LRU)
+    response_cache_ttl_seconds: float = 3600.0
+    response_cache_similarity: float = 0.95  # Cosine threshold for a semantic hit (1.0 = exact only)
+
+    # Chat routing
+    chat_fast_path: bool = True  # Skip the planning call when no tool intent is detected
+    chat_tool_mode: str = "native"  # "native" (tools parameter, json for models that reject it) or "json" (plan parsed from text)
+    chat_max_tool_rounds: int = 4  # Tool-call rounds before the model must answer
+    tool_thread_pool_size: int = 16  # Threads for synchronous tool modules
+    tool_max_concurrency_per_server: int = 4  # Concurrent calls to one tool server
+    tool_call_timeout: float = 30.0  # Seconds before a tool call is abandoned
+    disconnect_poll_interval: float = 0.5  # Seconds between client-disconnect checks during a chat
+
+    # Chat context gathering (per-provider timeouts, seconds)
+    web_search_timeout: float = 8.0
+    rag_timeout: float = 10.0
+    vision_timeout: float = 30.0
+    image_generation_timeout: float = 60.0
+
+    # Vector store ("supabase" = pgvector via REST, "local" = in-process NumPy index)
+    vector_store_backend: str = "supabase"
+    local_vector_store_path: str = ".cache/vectors"
+    local_vector_store_ann_threshold: int = 50_000  # Use HNSW (if hnswlib installed) above this size
+
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -0,0 +1,162 @@
+"""
+Concurrent context gathering for chat requests.
+
+Web search, document RAG, vision analysis and image generation are
+independent of each other, so they run concurrently, each under its own
+timeout. A slow or failing provider only loses its own part of the context;
+the request waits for the slowest provider instead of the sum of all of them.
+"""
+import time
+import asyncio
+from typing import Any, Awaitable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.context_packer import make_snippet
+from app.core.single_flight import single_flight
+
+# Queries that likely need fresh information trigger web search automatically
+WEB_SEARCH_KEYWORDS = ['latest', 'current', 'today', 'news', 'match', 'score', 'weather', 'stock', 'price', 'recent', 'update']
+
+# Queries that are likely about an uploaded image
+IMAGE_KEYWORDS = ['image', 'picture', 'photo', 'show', 'see', 'look', 'describe', 'what is in', 'what does']
+
+
+async def _web_search(message: str) -> Dict[str, Any]:
+    from app.tools.web_search import search_web
+
+    print(f"[Chat] Performing web search for: {message}")
+    # Identical searches already in flight (other users or tabs) share one request
+    results = await single_flight.do(("web", message), lambda: asyncio.to_thread(search_web, message, 5))
+    return {
+        "snippets": [
+            make_snippet("web", r["content"], rank, title=r["title"], url=r["url"])
+            for rank, r in enumerate(results)
+        ],
+        "sources": [
+            {"title": r["title"], "url": r["url"], "snippet": r["content"][:200] + "..."}
+            for r in results
+        ],
+    }
+
+
+async def _documents(conversation_id: str, message: str) -> Dict[str, Any]:
+    from app.core.rag import aget_rag_chunks
+
+    chunks = await aget_rag_chunks(conversation_id, message)
+    if not chunks:
+        return {}
+    print(f"[Chat] Found RAG context from documents")
+    return {
+        "snippets": [make_snippet("document", doc["content"], rank) for rank, doc in enumerate(chunks)],
+        "sources": [{"type": "document", "content": chunks[0]["content"][:200] + "..."}],
+    }
+
+
+async def _vision(image: Dict[str, Any], message: str) -> Dict[str, Any]:
+    from app.tools.vision_query import query_image_with_vision
+    from app.storage.blob_store import blob_store
+
+    print(f"[Chat] Conversation has images and query seems image-related, using vision model")
+
+    def query() -> str:
+        # Base64 is built from the mapped blob only for the provider request
+        return query_image_with_vision(
+            image_base64=blob_store.base64(image['blob_id']),
+            question=message,
+            image_format=image['format']
+        )
+
+    answer = await asyncio.to_thread(query)
+    return {
+        "snippets": [make_snippet("image", answer)],
+        "sources": [{"type": "image", "filename": image['filename']}],
+    }
+
+
+async def _image_generation(message: str) -> Dict[str, Any]:
+    from app.tools.image_generation import generate_image
+
+    print(f"[Chat] Generating image for: {message}")
+    result = await asyncio.to_thread(generate_image, message)
+    if not result.get('success'):
+        print(f"[Chat] Image generation failed: {result.get('error')}")
+        return {}
+    image_url = result.get('image_url')
+    print(f"[Chat] Image generated successfully: {image_url[:50] if image_url else 'None'}...")
+    return {"image_url": image_url}
+
+
+async def _run_with_timeout(name: str, coro: Awaitable[Dict[str, Any]], timeout: float) -> Dict[str, Any]:
+    """Run one provider; errors and timeouts yield an empty result."""
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(coro, timeout=timeout)
+        print(f"[Context] {name} finished in {time.perf_counter() - start:.2f}s")
+        return result or {}
+    except asyncio.TimeoutError:
+        print(f"[Context] {name} timed out after {timeout:g}s, continuing without it")
+    except Exception as e:
+        print(f"[Context] {name} error: {str(e)}")
+    return {}
+
+
+async def gather_context(
+    conversation_id: str,
+    message: str,
+    web_search: bool = False,
+    use_rag: bool = False,
+    image_generation: bool = False,
+) -> Dict[str, Any]:
+    """
+    Collect extra context for a chat message from all enabled providers at once.
+
+    Args:
+        conversation_id: Conversation being answered
+        message: User message
+        web_search: Web search explicitly requested
+        use_rag: Document RAG explicitly requested
+        image_generation: Image generation requested
+
+    Returns:
+        Dict with snippets (for pack_context), sources and image_url (or None)
+    """
+    from app.storage.chat_history import chat_history_store
+
+    lowered = message.lower()
+    tasks: Dict[str, Awaitable[Dict[str, Any]]] = {}
+    timeouts: Dict[str, float] = {}
+
+    if web_search or any(keyword in lowered for keyword in WEB_SEARCH_KEYWORDS):
+        tasks["web_search"] = _web_search(message)
+        timeouts["web_search"] = settings.web_search_timeout
+
+    # RAG is enabled if explicitly requested or if the conversation has images/docs
+    has_images = chat_history_store.has_images(conversation_id)
+    if use_rag or has_images:
+        tasks["documents"] = _documents(conversation_id, message)
+        timeouts["documents"] = settings.rag_timeout
+        if has_images and any(keyword in lowered for keyword in IMAGE_KEYWORDS):
+            latest_image = chat_history_store.get_conversation_images(conversation_id)[-1]
+            tasks["vision"] = _vision(latest_image, message)
+            timeouts["vision"] = settings.vision_timeout
+
+    if image_generation:
+        tasks["image_generation"] = _image_generation(message)
+        timeouts["image_generation"] = settings.image_generation_timeout
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        _run_with_timeout(name, coro, timeouts[name]) for name, coro in tasks.items()
+    ))
+    if tasks:
+        print(f"[Context] Gathered {', '.join(tasks)} in {time.perf_counter() - start:.2f}s")
+
+    snippets: List[Dict[str, Any]] = []
+    sources: List[Dict[str, Any]] = []
+    image_url: Optional[str] = None
+    for result in results:
+        snippets.extend(result.get("snippets", []))
+        sources.extend(result.get("sources", []))
+        image_url = result.get("image_url") or image_url
+
+    return {"snippets": snippets, "sources": sources, "image_url": image_url}
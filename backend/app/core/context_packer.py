@@ -0,0 +1,205 @@
+"""
+Token-budgeted context packing for chat prompts.
+
+RAG chunks, web search results and image analysis are ranked together,
+deduplicated and trimmed so the extra context stays within a per-model
+token budget. Token counts use tiktoken when its encoding is available and
+fall back to a conservative byte-based estimate otherwise.
+"""
+import re
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.embeddings import estimate_tokens
+
+try:
+    import tiktoken
+except Exception:
+    tiktoken = None
+
+# Approximate context windows (tokens) for models offered in the UI
+MODEL_CONTEXT_WINDOWS = {
+    "meta-llama/llama-3.3-70b-instruct:free": 131_072,
+    "mistralai/mistral-small-3.1-24b-instruct:free": 128_000,
+    "google/gemma-3-12b-it:free": 32_768,
+    "qwen/qwen3-next-80b-a3b-instruct:free": 262_144,
+    "nousresearch/hermes-3-llama-3.1-405b:free": 131_072,
+}
+DEFAULT_CONTEXT_WINDOW = 32_768
+
+# Relative weight of each source when ranking snippets across sources
+SOURCE_WEIGHTS = {
+    "image": 1.2,  # Only present when the user asked about an uploaded image
+    "document": 1.0,
+    "web": 0.9,
+}
+
+SOURCE_HEADERS = {
+    "image": "Image Analysis:",
+    "document": "Document Context:",
+    "web": "Here are the most relevant web search results:",
+}
+
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    """Load the tiktoken encoding once; None if unavailable (e.g. offline)."""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"[ContextPacker] tiktoken unavailable, using estimates: {e}")
+            _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Trim text to at most max_tokens, preferring a sentence boundary."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        trimmed = encoding.decode(tokens[:max_tokens])
+    else:
+        if estimate_tokens(text) <= max_tokens:
+            return text
+        trimmed = text.encode("utf-8")[:max_tokens * 3].decode("utf-8", errors="ignore")
+
+    cut = max(trimmed.rfind(". "), trimmed.rfind("\n"))
+    if cut > len(trimmed) // 2:
+        trimmed = trimmed[:cut + 1]
+    return trimmed.rstrip() + " …"
+
+
+def context_budget_for(model_name: str) -> int:
+    """Token budget for extra context: the configured cap, or a quarter of the model window."""
+    window = MODEL_CONTEXT_WINDOWS.get(model_name, DEFAULT_CONTEXT_WINDOW)
+    return min(settings.context_token_budget, window // 4)
+
+
+def make_snippet(source: str, text: str, rank: int = 0, title: Optional[str] = None, url: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build a snippet for pack_context.
+
+    Args:
+        source: "document", "web" or "image"
+        text: Snippet text
+        rank: Position within its own source's ranking (0 = best)
+        title: Optional title (web results)
+        url: Optional URL (web results)
+    """
+    return {
+        "source": source,
+        "text": text,
+        "score": SOURCE_WEIGHTS.get(source, 1.0) / (1 + rank),
+        "title": title,
+        "url": url,
+    }
+
+
+def _fingerprint(text: str) -> str:
+    normalized = re.sub(r"\W+", " ", text.lower()).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def pack_context(snippets: List[Dict[str, Any]], budget_tokens: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    Rank, deduplicate and trim snippets into a context block.
+
+    Snippets are taken in score order; exact and near duplicates (>= 80%
+    shingle overlap with an accepted snippet) are dropped, and the snippet
+    that crosses the budget is trimmed if enough room remains.
+
+    Args:
+        snippets: Snippets from make_snippet
+        budget_tokens: Maximum tokens for the whole context block
+
+    Returns:
+        (context text, report with tokens used and snippet counts)
+    """
+    accepted: List[Dict[str, Any]] = []
+    seen = set()
+    accepted_shingles: List[set] = []
+    used = 0
+    dropped = duplicates = trimmed = 0
+    min_tokens = settings.context_min_snippet_tokens
+
+    for snippet in sorted(snippets, key=lambda s: s["score"], reverse=True):
+        text = snippet["text"].strip()
+        if not text:
+            continue
+
+        fingerprint = _fingerprint(text)
+        shingles = _shingles(text)
+        if fingerprint in seen or any(
+            len(shingles & other) >= 0.8 * min(len(shingles), len(other)) for other in accepted_shingles
+        ):
+            duplicates += 1
+            continue
+
+        # Account for the title line and, for a source's first snippet, its header
+        body = f"{snippet['title']}\n{text}" if snippet.get("title") else text
+        overhead = 8 if snippet.get("url") else 2
+        if not any(s["source"] == snippet["source"] for s in accepted):
+            overhead += count_tokens(SOURCE_HEADERS.get(snippet["source"], "")) + 2
+        tokens = count_tokens(body) + overhead
+        remaining = budget_tokens - used
+        if tokens > remaining:
+            if remaining - overhead < min_tokens:
+                dropped += 1
+                continue
+            body = truncate_to_tokens(body, remaining - overhead)
+            tokens = count_tokens(body) + overhead
+            trimmed += 1
+
+        seen.add(fingerprint)
+        accepted_shingles.append(shingles)
+        accepted.append({**snippet, "body": body})
+        used += tokens
+
+    # Group accepted snippets under their source header, in source priority order
+    sections = []
+    for source in SOURCE_HEADERS:
+        bodies = [s for s in accepted if s["source"] == source]
+        if not bodies:
+            continue
+        lines = [SOURCE_HEADERS[source]]
+        for i, s in enumerate(bodies, 1):
+            if source == "web" and s.get("url"):
+                lines.append(f"{i}. {s['body']}\n   URL: {s['url']}")
+            else:
+                lines.append(s["body"])
+        sections.append("\n\n".join(lines))
+
+    context = "\n\n".join(sections)
+    report = {
+        "budget_tokens": budget_tokens,
+        "context_tokens": count_tokens(context) if context else 0,
+        "snippets_used": len(accepted),
+        "snippets_trimmed": trimmed,
+        "snippets_dropped": dropped,
+        "duplicates_removed": duplicates,
+    }
+    print(f"[ContextPacker] {report['context_tokens']}/{budget_tokens} tokens, "
+          f"{len(accepted)} snippets ({trimmed} trimmed, {dropped} dropped, {duplicates} duplicates)")
+    return context, report
@@ -1,15 +1,33 @@
 """
 Database connection and Supabase client initialization.
+
+All queries share pooled HTTP clients (keep-alive, HTTP/2 when h2 is
+installed), so a query reuses an open connection instead of paying a TCP+TLS
+handshake. Query builders are awaitable for use in async handlers:
+
+    result = await supabase.table("users").select("id").eq("email", email)
+    result = await supabase.table("users").ainsert({...})
+
+The synchronous methods (execute, insert, delete) remain for scripts and
+sync code paths.
 """
+import asyncio
 import httpx
 from typing import Any, Dict, List, Optional
 from app.core.config import settings
 
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except Exception:
+    HTTP2_AVAILABLE = False
+
 
 class SupabaseClient:
-    """Lightweight Supabase client using httpx."""
-    
-    def __init__(self, url: str, key: str):
+    """Lightweight Supabase client using pooled httpx clients."""
+
+    def __init__(self, url: str, key: str, max_connections: int = 20, max_keepalive_connections: int = 10,
+                 timeout: float = 10.0):
         self.url = url.rstrip('/')
         self.key = key
         self.headers = {
@@ -18,80 +36,128 @@ class SupabaseClient:
             "Content-Type": "application/json",
             "Prefer": "return=representation"
         }
-    
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self.timeout = timeout
+        self._sync_client: Optional[httpx.Client] = None
+        self._async_clients: Dict[int, httpx.AsyncClient] = {}  # httpx async clients are bound to one event loop
+
     def table(self, table_name: str):
         """Get table interface."""
         return SupabaseTable(self, table_name)
 
+    def sync_client(self) -> httpx.Client:
+        """Shared client for synchronous calls."""
+        if self._sync_client is None or self._sync_client.is_closed:
+            self._sync_client = httpx.Client(
+                headers=self.headers, timeout=self.timeout, limits=self.limits, http2=HTTP2_AVAILABLE
+            )
+        return self._sync_client
+
+    def async_client(self) -> httpx.AsyncClient:
+        """Shared client for the running event loop."""
+        loop_id = id(asyncio.get_running_loop())
+        client = self._async_clients.get(loop_id)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                headers=self.headers, timeout=self.timeout, limits=self.limits, http2=HTTP2_AVAILABLE
+            )
+            self._async_clients[loop_id] = client
+            print(f"[Database] New Supabase HTTP client (http2={HTTP2_AVAILABLE})")
+        return client
+
+    async def aclose(self):
+        """Close pooled connections (call on application shutdown)."""
+        clients, self._async_clients = list(self._async_clients.values()), {}
+        for client in clients:
+            try:
+                await client.aclose()
+            except RuntimeError:
+                pass  # Client belonged to an event loop that is already closed
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
 
 class SupabaseTable:
-    """Table interface for Supabase."""
-    
+    """Table interface for Supabase (awaiting it runs the select query)."""
+
     def __init__(self, client: SupabaseClient, table_name: str):
         self.client = client
         self.table_name = table_name
         self.url = f"{client.url}/rest/v1/{table_name}"
         self._select_fields = "*"
         self._filters = []
-    
+
     def select(self, fields: str = "*"):
         """Select fields."""
         self._select_fields = fields
         return self
-    
+
     def eq(self, column: str, value: Any):
         """Add equality filter."""
         self._filters.append(f"{column}=eq.{value}")
         return self
-    
-    def execute(self):
-        """Execute the query."""
+
+    def _query_url(self, select: bool) -> str:
         url = self.url
-        if self._select_fields:
+        if select and self._select_fields:
             url += f"?select={self._select_fields}"
         if self._filters:
             separator = "&" if "?" in url else "?"
             url += separator + "&".join(self._filters)
-        
-        response = httpx.get(url, headers=self.client.headers, timeout=10.0)
+        return url
+
+    @staticmethod
+    def _response(response: httpx.Response) -> "SupabaseResponse":
         response.raise_for_status()
-        
+        # DELETE usually returns 204 No Content, but Supabase might return data if Prefer: return=representation
+        if response.status_code == 204:
+            return SupabaseResponse([])
         return SupabaseResponse(response.json())
-    
+
+    def execute(self):
+        """Execute the query."""
+        return self._response(self.client.sync_client().get(self._query_url(select=True)))
+
     def insert(self, data: Dict[str, Any]):
         """Insert data."""
-        response = httpx.post(
-            self.url,
-            json=data,
-            headers=self.client.headers,
-            timeout=10.0
-        )
-        response.raise_for_status()
-        
-        return SupabaseResponse(response.json())
+        return self._response(self.client.sync_client().post(self.url, json=data))
 
     def delete(self):
         """Delete records matching filters."""
-        url = self.url
-        if self._filters:
-            separator = "&" if "?" in url else "?"
-            url += separator + "&".join(self._filters)
-        
-        response = httpx.delete(url, headers=self.client.headers, timeout=10.0)
-        response.raise_for_status()
-        
-        # DELETE usually returns 204 No Content, but Supabase might return data if Prefer: return=representation
-        if response.status_code == 204:
-            return SupabaseResponse([])
-        return SupabaseResponse(response.json())
+        return self._response(self.client.sync_client().delete(self._query_url(select=False)))
+
+    async def aexecute(self):
+        """Execute the query without blocking the event loop."""
+        return self._response(await self.client.async_client().get(self._query_url(select=True)))
+
+    async def ainsert(self, data: Any):
+        """Insert a row (dict) or rows (list of dicts)."""
+        return self._response(await self.client.async_client().post(self.url, json=data))
+
+    async def adelete(self):
+        """Delete records matching filters."""
+        return self._response(await self.client.async_client().delete(self._query_url(select=False)))
+
+    def __await__(self):
+        return self.aexecute().__await__()
 
 
 class SupabaseResponse:
     """Response wrapper."""
-    
+
     def __init__(self, data: Any):
         self.data = data if isinstance(data, list) else [data] if data else []
 
 
 # Global client instance
-supabase = SupabaseClient(settings.supabase_url, settings.supabase_key)
+supabase = SupabaseClient(
+    settings.supabase_url,
+    settings.supabase_key,
+    max_connections=settings.supabase_max_connections,
+    max_keepalive_connections=settings.supabase_max_keepalive_connections,
+    timeout=settings.supabase_timeout
+)
@@ -1,46 +1,175 @@
 """
 Direct Tool Executor - Uses native Python tool implementations instead of MCP SDK.
+
+Tool modules are synchronous (googleapiclient, requests), so their calls run
+in a dedicated, sized thread pool and never block the event loop. Each server
+has its own concurrency limit, so one slow provider can't take every thread.
+Modules that define `async def execute_tool` are awaited directly.
 """
-from typing import Dict, Any, List
+import time
+import asyncio
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+from app.core.config import settings
 from app.tools import gmail_tools, calendar_tools, notion_tools
 
 
 class DirectToolExecutor:
     """Executes tools directly without MCP."""
-    
-    def __init__(self):
+
+    def __init__(self, pool_size: int = 16, max_concurrency_per_server: int = 4):
         self.tool_modules = {
             'gmail': gmail_tools,
             'google-calendar': calendar_tools,
             'notion': notion_tools
         }
-    
+        self.pool_size = pool_size
+        self.max_concurrency_per_server = max_concurrency_per_server
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._server_limits: Dict[str, asyncio.Semaphore] = {}
+
+        # Counters (updated from pool threads, hence the lock)
+        self._lock = threading.Lock()
+        self._waiting: Dict[str, int] = {}  # Blocked on the server limit
+        self._queued = 0  # Submitted to the pool, no thread yet
+        self._running = 0
+        self._calls: Dict[str, Dict[str, float]] = {}
+        self.cancelled = 0  # Calls abandoned by their request (waiting, queued or running)
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="tool")
+            print(f"[ToolExecutor] Started tool thread pool ({self.pool_size} threads)")
+        return self._pool
+
+    def shutdown(self):
+        """Stop the tool thread pool (call on application shutdown)."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _server_limit(self, server_name: str) -> asyncio.Semaphore:
+        if server_name not in self._server_limits:
+            self._server_limits[server_name] = asyncio.Semaphore(self.max_concurrency_per_server)
+        return self._server_limits[server_name]
+
+    def _record(self, server_name: str, seconds: float, failed: bool):
+        with self._lock:
+            calls = self._calls.setdefault(server_name, {"calls": 0, "failed": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            calls["calls"] += 1
+            calls["failed"] += int(failed)
+            calls["total_seconds"] += seconds
+            calls["max_seconds"] = max(calls["max_seconds"], seconds)
+
+    def _count_cancelled(self, server_name: str):
+        with self._lock:
+            self.cancelled += 1
+        print(f"[ToolExecutor] Cancelled {server_name} call (request abandoned)")
+
+    def _run_in_thread(self, func, *args):
+        """Pool entry point: moves the call from queued to running."""
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
     async def execute_tool(self, server_name: str, tool_name: str, arguments: Dict[str, Any]) -> Any:
         """
         Execute a tool directly.
-        
+
         Args:
             server_name: Server name (gmail, google-calendar, notion)
             tool_name: Tool name
             arguments: Tool arguments
-            
+
         Returns:
             Tool execution result
         """
         if server_name not in self.tool_modules:
             return {'success': False, 'error': f'Server {server_name} not found'}
-        
+
         module = self.tool_modules[server_name]
-        return module.execute_tool(tool_name, arguments)
-    
+
+        with self._lock:
+            self._waiting[server_name] = self._waiting.get(server_name, 0) + 1
+        try:
+            await self._server_limit(server_name).acquire()
+        except asyncio.CancelledError:
+            self._count_cancelled(server_name)
+            raise
+        finally:
+            with self._lock:
+                self._waiting[server_name] -= 1
+
+        limit = self._server_limit(server_name)
+        start = time.perf_counter()
+        failed = True
+        future = None
+        release_when_done = False
+        try:
+            if inspect.iscoroutinefunction(module.execute_tool):
+                result = await module.execute_tool(tool_name, arguments)
+            else:
+                with self._lock:
+                    self._queued += 1
+                future = self._get_pool().submit(self._run_in_thread, module.execute_tool, tool_name, arguments)
+                result = await asyncio.wrap_future(future)
+            failed = isinstance(result, dict) and result.get('success') is False
+            return result
+        except asyncio.CancelledError:
+            # A queued call gives its slot back; a running one finishes but its result is dropped
+            if future is not None:
+                if future.cancel():
+                    with self._lock:
+                        self._queued -= 1
+                else:
+                    # The thread still occupies the server, so its slot is released only when it ends
+                    release_when_done = True
+                    loop = asyncio.get_running_loop()
+                    future.add_done_callback(lambda _: loop.call_soon_threadsafe(limit.release))
+            self._count_cancelled(server_name)
+            raise
+        finally:
+            if not release_when_done:
+                limit.release()
+            self._record(server_name, time.perf_counter() - start, failed)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool utilisation, queue depth and per-server latency."""
+        with self._lock:
+            servers = {
+                name: {
+                    "calls": int(calls["calls"]),
+                    "failed": int(calls["failed"]),
+                    "avg_ms": round(calls["total_seconds"] / calls["calls"] * 1000, 1),
+                    "max_ms": round(calls["max_seconds"] * 1000, 1),
+                    "waiting": self._waiting.get(name, 0),
+                }
+                for name, calls in self._calls.items()
+            }
+            return {
+                "pool_size": self.pool_size,
+                "running": self._running,
+                "queue_depth": self._queued,
+                "waiting_for_server_limit": sum(self._waiting.values()),
+                "cancelled": self.cancelled,
+                "servers": servers,
+            }
+
     async def list_tools(self, server_name: str) -> List[Dict[str, Any]]:
         """List available tools for a server."""
         if server_name not in self.tool_modules:
             return []
-        
+
         module = self.tool_modules[server_name]
         return module.list_tools()
-    
+
     async def get_all_tools(self, server_names: List[str]) -> Dict[str, List[Dict[str, Any]]]:
         """Get all tools for requested servers."""
         all_tools = {}
@@ -50,4 +179,7 @@ class DirectToolExecutor:
 
 
 # Global instance
-direct_executor = DirectToolExecutor()
+direct_executor = DirectToolExecutor(
+    pool_size=settings.tool_thread_pool_size,
+    max_concurrency_per_server=settings.tool_max_concurrency_per_server
+)
@@ -0,0 +1,160 @@
+"""
+Streaming document text extraction.
+
+PDF page ranges are extracted in a shared process pool and yielded in page
+order as soon as each range finishes, with at most `page_window` pages in
+flight, so callers can start chunking before extraction completes and memory
+is bounded by the window rather than the document.
+"""
+import os
+import asyncio
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from pypdf import PdfReader
+
+from app.core.config import settings
+
+# Shared process pool for PDF extraction (created lazily)
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    if _pdf_pool is None:
+        workers = settings.pdf_extract_workers or min(4, os.cpu_count() or 1)
+        _pdf_pool = ProcessPoolExecutor(max_workers=workers)
+        print(f"[Loader] Started PDF extraction pool ({workers} workers)")
+    return _pdf_pool
+
+
+def shutdown_pdf_pool():
+    """Stop the extraction pool (call on application shutdown)."""
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=False, cancel_futures=True)
+        _pdf_pool = None
+
+
+def _extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """Extract text for pages [start, end). Runs in a worker process."""
+    reader = PdfReader(path)
+    pages = []
+    for page_num in range(start, end):
+        try:
+            pages.append(reader.pages[page_num].extract_text() or "")
+        except Exception as e:
+            print(f"[Loader] Error extracting page {page_num + 1}: {e}")
+            pages.append("")
+    return pages
+
+
+def _page_ranges(page_count: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+
+def _decode_text(file_content: bytes) -> str:
+    try:
+        return file_content.decode('utf-8')
+    except UnicodeDecodeError:
+        return file_content.decode('latin-1')
+
+
+class _SpooledPdf:
+    """PDF bytes written to a temp file so workers read pages lazily instead of receiving the whole file."""
+
+    def __init__(self, file_content: bytes):
+        fd, self.path = tempfile.mkstemp(suffix=".pdf")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(file_content)
+            self.page_count = len(PdfReader(self.path).pages)
+        except Exception:
+            # Corrupt or encrypted upload: nobody will call close()
+            self.close()
+            raise
+
+    def close(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _window_tasks() -> int:
+    pages_per_task = max(1, settings.pdf_pages_per_task)
+    return max(1, settings.pdf_page_window // pages_per_task)
+
+
+def iter_document_pages(file_content: bytes, filename: str) -> Iterator[str]:
+    """
+    Yield page texts in order (a plain text file is a single page).
+
+    Args:
+        file_content: Raw file bytes
+        filename: Original filename
+
+    Yields:
+        Text of each page
+    """
+    if not filename.lower().endswith('.pdf'):
+        yield _decode_text(file_content)
+        return
+
+    pdf = _SpooledPdf(file_content)
+    try:
+        ranges = _page_ranges(pdf.page_count, max(1, settings.pdf_pages_per_task))
+        if len(ranges) <= 1:
+            # Small document: not worth the process hop
+            yield from _extract_page_range(pdf.path, 0, pdf.page_count)
+            return
+
+        pool = _get_pdf_pool()
+        pending = deque()
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < _window_tasks():
+                start, end = ranges[next_range]
+                pending.append(pool.submit(_extract_page_range, pdf.path, start, end))
+                next_range += 1
+            yield from pending.popleft().result()
+    finally:
+        pdf.close()
+
+
+async def aiter_document_pages(file_content: bytes, filename: str) -> AsyncIterator[str]:
+    """
+    Async variant of iter_document_pages; never blocks the event loop.
+
+    Args:
+        file_content: Raw file bytes
+        filename: Original filename
+
+    Yields:
+        Text of each page
+    """
+    if not filename.lower().endswith('.pdf'):
+        yield _decode_text(file_content)
+        return
+
+    loop = asyncio.get_running_loop()
+    pdf = await asyncio.to_thread(_SpooledPdf, file_content)
+    pending = deque()
+    try:
+        ranges = _page_ranges(pdf.page_count, max(1, settings.pdf_pages_per_task))
+        print(f"[Loader] Extracting {pdf.page_count} pages in {len(ranges)} range(s)")
+        pool = _get_pdf_pool()
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < _window_tasks():
+                start, end = ranges[next_range]
+                pending.append(loop.run_in_executor(pool, _extract_page_range, pdf.path, start, end))
+                next_range += 1
+            for page_text in await pending.popleft():
+                yield page_text
+    finally:
+        for future in pending:
+            future.cancel()
+        pdf.close()
@@ -0,0 +1,200 @@
+"""
+Content-addressed embedding cache.
+
+Vectors are keyed by model name + SHA-256 of the text and kept in two tiers:
+- an in-process LRU (hot queries and recently uploaded chunks)
+- a local SQLite file of float32 blobs that survives restarts
+"""
+import os
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+def embedding_key(model: str, text: str) -> str:
+    """Cache key for a (model, text) pair."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+class EmbeddingCache:
+    """Two-tier (LRU memory + SQLite) embedding cache."""
+
+    def __init__(self, max_entries: int = 10_000, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+                )
+                self._db.commit()
+            except Exception as e:
+                print(f"[EmbeddingCache] Disk tier disabled ({db_path}): {e}")
+                self._db = None
+
+    def _remember(self, key: str, vector: List[float]):
+        """Insert into the LRU tier, evicting the oldest entries."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _get_memory(self, keys: List[str]) -> Tuple[Dict[str, List[float]], List[str]]:
+        """Look up keys in the LRU tier. Returns (hits, missing keys)."""
+        found: Dict[str, List[float]] = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self.memory_hits += 1
+                else:
+                    missing.append(key)
+            if self._db is None:
+                self.misses += len(missing)
+        return found, missing
+
+    def _get_disk(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Look up keys on disk, promoting hits to memory."""
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            # SQLite caps bound parameters, so query in slices
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f", blob).tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Look up keys in memory, then on disk. Returns only the hits."""
+        found, missing = self._get_memory(keys)
+        if missing and self._db is not None:
+            found.update(self._get_disk(missing))
+        return found
+
+    async def aget_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """get_many with the disk tier read in a worker thread."""
+        found, missing = self._get_memory(keys)
+        if missing and self._db is not None:
+            found.update(await asyncio.to_thread(self._get_disk, missing))
+        return found
+
+    def _put_memory(self, items: Dict[str, List[float]]):
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+
+    def _put_disk(self, items: Dict[str, List[float]]):
+        rows = [(key, array("f", vector).tobytes()) for key, vector in items.items()]
+        with self._lock:
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                self._db.commit()
+            except Exception as e:
+                print(f"[EmbeddingCache] Error writing to disk tier: {e}")
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """Store vectors in both tiers."""
+        if not items:
+            return
+        self._put_memory(items)
+        if self._db is not None:
+            self._put_disk(items)
+
+    async def aput_many(self, items: Dict[str, List[float]]):
+        """put_many with the disk tier written in a worker thread."""
+        if not items:
+            return
+        self._put_memory(items)
+        if self._db is not None:
+            await asyncio.to_thread(self._put_disk, items)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+class CachedEmbeddings:
+    """Wraps an embedding client so repeated texts cost no API calls."""
+
+    def __init__(self, embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = embeddings.model
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, only sending cache misses to the provider."""
+        keys = [embedding_key(self.model, text) for text in texts]
+        found = await self.cache.aget_many(list(dict.fromkeys(keys)))
+
+        # Deduplicate misses so identical chunks are embedded once
+        pending: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in pending:
+                pending[key] = text
+
+        if pending:
+            vectors = await self.embeddings.aembed_documents(list(pending.values()))
+            fresh = dict(zip(pending.keys(), vectors))
+            await self.cache.aput_many(fresh)
+            found.update(fresh)
+
+        print(f"[EmbeddingCache] {len(texts) - len(pending)}/{len(texts)} cached, {len(pending)} embedded")
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a single query; concurrent identical queries share one request."""
+        from app.core.single_flight import single_flight
+
+        key = ("embed", embedding_key(self.model, text))
+        return await single_flight.do(key, lambda: self._aembed_one(text))
+
+    async def _aembed_one(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of documents (sync wrapper for scripts)."""
+        return asyncio.run(self.aembed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query (sync wrapper for scripts)."""
+        return self.embed_documents([text])[0]
+
+    async def aclose(self):
+        await self.embeddings.aclose()
+
+    def stats(self) -> Dict[str, int]:
+        return self.cache.stats()
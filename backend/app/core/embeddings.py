@@ -0,0 +1,171 @@
+"""
+Batched, async embedding client for OpenAI-compatible embedding APIs (OpenRouter).
+
+Chunks are packed into as few requests as possible (capped by input count,
+estimated tokens and payload bytes) and batches are sent concurrently over a
+pooled httpx.AsyncClient.
+"""
+import asyncio
+from typing import List, Optional
+
+import httpx
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Conservative token estimate used for batch packing.
+
+    Assumes ~3 UTF-8 bytes per token so batches stay under provider limits
+    even for non-English text.
+    """
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+class OpenRouterEmbeddings:
+    """Batched HTTP calls to OpenRouter for OpenAI embeddings."""
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "openai/text-embedding-3-small",
+        api_url: str = "https://openrouter.ai/api/v1/embeddings",
+        max_batch_size: int = 128,
+        max_batch_tokens: int = 250_000,
+        max_batch_bytes: int = 2_000_000,
+        max_concurrency: int = 4,
+        timeout: float = 60.0,
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.api_url = api_url
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_bytes = max_batch_bytes
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+        # Pooled client, bound to the event loop that created it
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        Get the pooled AsyncClient for the running loop.
+
+        Sync callers go through asyncio.run(), which creates a fresh loop each
+        time, so a client from a previous (closed) loop is replaced.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self):
+        """Close the pooled client (call on application shutdown)."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+
+    def _make_batches(self, texts: List[str]) -> List[List[int]]:
+        """
+        Pack text indices into batches capped by size, tokens and bytes.
+
+        A single text larger than the caps still gets its own batch; the
+        provider decides whether it is acceptable.
+        """
+        batches = []
+        current: List[int] = []
+        current_tokens = 0
+        current_bytes = 0
+
+        for i, text in enumerate(texts):
+            text_bytes = len(text.encode("utf-8"))
+            text_tokens = estimate_tokens(text)
+
+            if current and (
+                len(current) >= self.max_batch_size
+                or current_tokens + text_tokens > self.max_batch_tokens
+                or current_bytes + text_bytes > self.max_batch_bytes
+            ):
+                batches.append(current)
+                current, current_tokens, current_bytes = [], 0, 0
+
+            current.append(i)
+            current_tokens += text_tokens
+            current_bytes += text_bytes
+
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _embed_batch(self, client: httpx.AsyncClient, inputs: List[str]) -> List[List[float]]:
+        """Send one embeddings request and return vectors in input order."""
+        response = await client.post(
+            self.api_url,
+            json={
+                "model": self.model,
+                "input": inputs
+            }
+        )
+
+        if response.status_code != 200:
+            raise ValueError(f"OpenRouter API error: {response.status_code} - {response.text}")
+
+        result = response.json()
+        # OpenAI format: {data: [{index: i, embedding: [...]}, ...]}
+        data = result.get("data") if isinstance(result, dict) else None
+        if not data or len(data) != len(inputs):
+            raise ValueError(f"Unexpected response format: {str(result)[:500]}")
+
+        data = sorted(data, key=lambda item: item.get("index", 0))
+        return [item["embedding"] for item in data]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of documents using concurrent batched requests."""
+        if not texts:
+            return []
+
+        client = self._get_client()
+        batches = self._make_batches(texts)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(indices: List[int]) -> List[List[float]]:
+            async with semaphore:
+                return await self._embed_batch(client, [texts[i] for i in indices])
+
+        print(f"[Embeddings] Embedding {len(texts)} texts in {len(batches)} batch(es)")
+        batch_results = await asyncio.gather(*(run(indices) for indices in batches))
+
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        for indices, vectors in zip(batches, batch_results):
+            for i, vector in zip(indices, vectors):
+                embeddings[i] = vector
+        return embeddings
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a single query."""
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of documents (sync wrapper for scripts)."""
+        return asyncio.run(self.aembed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query (sync wrapper for scripts)."""
+        return self.embed_documents([text])[0]
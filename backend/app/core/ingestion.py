@@ -0,0 +1,212 @@
+"""
+Background ingestion jobs for uploaded documents.
+
+/api/upload enqueues a job and returns immediately. A bounded pool of worker
+tasks runs extract -> chunk -> embed -> store and records progress per stage
+so clients can poll a job or cancel it.
+"""
+import time
+import uuid
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+# Terminal job states
+FINISHED_STATES = {"completed", "failed", "cancelled"}
+
+
+class IngestionJob:
+    """State of one document ingestion."""
+
+    def __init__(self, conversation_id: str, filename: str, content: bytes):
+        self.job_id = str(uuid.uuid4())
+        self.conversation_id = conversation_id
+        self.filename = filename
+        self.size_bytes = len(content)
+        self.status = "queued"  # queued | running | completed | failed | cancelled
+        self.stage = "queued"  # queued | extracting | embedding | storing | done
+        self.progress: Dict[str, int] = {"pages": 0, "chunks": 0, "embedded": 0, "stored": 0}
+        self.error: Optional[str] = None
+        self.text_length = 0
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+        self._content: Optional[bytes] = content  # Released once the job finishes
+        self._task: Optional[asyncio.Task] = None
+        self._finished_monotonic: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def update(self, stage: str, **counts: int):
+        """Progress callback passed to the ingestion pipeline."""
+        self.stage = stage
+        self.progress.update(counts)
+
+    def finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        if status == "completed":
+            self.stage = "done"
+        self.finished_at = datetime.utcnow()
+        self._finished_monotonic = time.monotonic()
+        self._content = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "conversation_id": self.conversation_id,
+            "filename": self.filename,
+            "size_bytes": self.size_bytes,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": dict(self.progress),
+            "text_length": self.text_length,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestionQueue:
+    """Bounded queue of ingestion jobs served by a fixed pool of worker tasks."""
+
+    def __init__(self, workers: int = 2, max_pending: int = 32, job_ttl_seconds: int = 3600):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.job_ttl_seconds = job_ttl_seconds
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """Start worker tasks on the running event loop (idempotent)."""
+        if self._worker_tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(i), name=f"ingestion-worker-{i}")
+            for i in range(self.workers)
+        ]
+        print(f"[Ingestion] Started {self.workers} workers (max {self.max_pending} pending jobs)")
+
+    async def stop(self):
+        """Cancel workers and any running jobs."""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queue = None
+
+    def submit(self, conversation_id: str, filename: str, content: bytes) -> IngestionJob:
+        """
+        Enqueue a document for ingestion.
+
+        Raises:
+            asyncio.QueueFull: If max_pending jobs are already waiting
+        """
+        self.start()
+        self._prune()
+        job = IngestionJob(conversation_id, filename, content)
+        self._queue.put_nowait(job)
+        self._jobs[job.job_id] = job
+        print(f"[Ingestion] Queued job {job.job_id} for {filename} ({job.size_bytes} bytes)")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job.
+
+        Jobs that already reached the storing stage are not cancelled, since
+        the backend write may complete regardless and leave the job state wrong.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.finished or job.stage == "storing":
+            return False
+        if job._task is not None:
+            job._task.cancel()
+        else:
+            job.finish("cancelled")
+        print(f"[Ingestion] Cancelled job {job_id}")
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": len(self._worker_tasks),
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            **counts,
+        }
+
+    def _prune(self):
+        """Forget finished jobs older than the TTL."""
+        cutoff = time.monotonic() - self.job_ttl_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job._finished_monotonic is not None and job._finished_monotonic < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.finished:  # Cancelled while queued
+                    continue
+                job._task = asyncio.create_task(self._run(job))
+                try:
+                    # wait() does not propagate the job's own cancellation
+                    await asyncio.wait([job._task])
+                except asyncio.CancelledError:
+                    job._task.cancel()
+                    raise
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: IngestionJob):
+        from app.core.rag import aingest_pages
+        from app.core.document_loader import aiter_document_pages
+
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        job.update("extracting")
+        start = time.perf_counter()
+        try:
+            result = await aingest_pages(
+                job.conversation_id,
+                aiter_document_pages(job._content, job.filename),
+                document_id=job.job_id,
+                min_chars=100,
+                progress=job.update
+            )
+            job.text_length = result.get("text_length", 0)
+            if result["success"]:
+                job.finish("completed")
+            elif job.text_length < 100:
+                job.finish("failed", "Could not extract sufficient text from document")
+            else:
+                job.finish("failed", result.get("error") or "Failed to create vector store")
+        except asyncio.CancelledError:
+            job.finish("cancelled")
+        except Exception as e:
+            job.finish("failed", str(e))
+        print(f"[Ingestion] Job {job.job_id} {job.status} in {time.perf_counter() - start:.2f}s")
+
+
+# Global ingestion queue instance
+ingestion_queue = IngestionQueue(
+    workers=settings.ingestion_workers,
+    max_pending=settings.ingestion_max_pending,
+    job_ttl_seconds=settings.ingestion_job_ttl_seconds
+)
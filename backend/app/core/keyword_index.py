@@ -0,0 +1,286 @@
+"""
+Per-conversation inverted index with BM25 scoring.
+
+Built at ingestion time alongside the vector store so exact terms (policy
+numbers, names, error codes) can be matched even when dense similarity
+misses them. Postings are kept compact: each term maps to a byte string of
+varint-encoded (doc-id gap, term frequency) pairs.
+"""
+import os
+import re
+import json
+import math
+import time
+import base64
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+# Keeps codes like "HR-101", "E1234", "v2.3" and "snake_case" as single terms
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it of on or that the this "
+    "to was were what when where which who why will with about does do can my our your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase terms with stopwords removed."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def _encode_varints(values: List[int]) -> bytes:
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def _decode_varints(data: bytes) -> List[int]:
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+class _Postings:
+    """Compressed postings list for one term."""
+
+    __slots__ = ("data", "df", "last_doc")
+
+    def __init__(self, data: bytes = b"", df: int = 0, last_doc: int = -1):
+        self.data = bytearray(data)
+        self.df = df
+        self.last_doc = last_doc
+
+    def append(self, doc_id: int, tf: int):
+        self.data += _encode_varints([doc_id - self.last_doc if self.df else doc_id, tf])
+        self.last_doc = doc_id
+        self.df += 1
+
+    def __iter__(self):
+        values = _decode_varints(self.data)
+        doc_id = 0
+        for i in range(0, len(values), 2):
+            doc_id = values[i] if i == 0 else doc_id + values[i]
+            yield doc_id, values[i + 1]
+
+
+class KeywordIndex:
+    """BM25 index over the chunks of one conversation."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.records: List[Dict[str, Any]] = []  # {"content": ..., "metadata": ...}
+        self.doc_lengths: List[int] = []
+        self.total_length = 0
+        self.postings: Dict[str, _Postings] = {}
+
+    def add(self, contents: List[str], metadatas: List[Dict[str, Any]]):
+        for content, metadata in zip(contents, metadatas):
+            doc_id = len(self.records)
+            terms = tokenize(content)
+            self.records.append({"content": content, "metadata": metadata})
+            self.doc_lengths.append(len(terms))
+            self.total_length += len(terms)
+            for term, tf in Counter(terms).items():
+                self.postings.setdefault(term, _Postings()).append(doc_id, tf)
+
+    def search(self, query: str, k: int = 4) -> List[Dict[str, Any]]:
+        """Top-k chunks by BM25 score."""
+        n = len(self.records)
+        if not n:
+            return []
+        avg_length = self.total_length / n or 1.0
+        scores: Dict[int, float] = {}
+
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            idf = math.log(1 + (n - postings.df + 0.5) / (postings.df + 0.5))
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            {
+                "content": self.records[doc_id]["content"],
+                "metadata": self.records[doc_id]["metadata"],
+                "bm25": score
+            }
+            for doc_id, score in top
+        ]
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "records": self.records,
+            "doc_lengths": self.doc_lengths,
+            "postings": {
+                term: [base64.b64encode(bytes(p.data)).decode("ascii"), p.df, p.last_doc]
+                for term, p in self.postings.items()
+            }
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "KeywordIndex":
+        index = cls()
+        index.records = data["records"]
+        index.doc_lengths = data["doc_lengths"]
+        index.total_length = sum(index.doc_lengths)
+        index.postings = {
+            term: _Postings(base64.b64decode(encoded), df, last_doc)
+            for term, (encoded, df, last_doc) in data["postings"].items()
+        }
+        return index
+
+
+class KeywordIndexStore:
+    """
+    Keyword indexes for all conversations.
+
+    Indexes are persisted as one JSON file per conversation and kept in an
+    LRU of loaded indexes; a file changed by another worker is reloaded.
+    """
+
+    def __init__(self, root: str, max_loaded: int = 64):
+        self.root = root
+        self.max_loaded = max_loaded
+        self._loaded: "OrderedDict[str, Tuple[float, KeywordIndex]]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, conversation_id: str) -> str:
+        name = hashlib.sha256(conversation_id.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.root, f"{name}.json")
+
+    def _get(self, conversation_id: str) -> Optional[KeywordIndex]:
+        path = self._path(conversation_id)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            self._loaded.pop(conversation_id, None)
+            return None
+
+        cached = self._loaded.get(conversation_id)
+        if cached is not None and cached[0] == mtime:
+            self._loaded.move_to_end(conversation_id)
+            return cached[1]
+
+        with open(path, "r", encoding="utf-8") as f:
+            index = KeywordIndex.from_json(json.load(f))
+        self._loaded[conversation_id] = (mtime, index)
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+        return index
+
+    def add(self, conversation_id: str, contents: List[str], metadatas: List[Dict[str, Any]]):
+        """Index chunks and persist the conversation's index."""
+        with self._lock:
+            index = self._get(conversation_id) or KeywordIndex()
+            index.add(contents, metadatas)
+            self._save(conversation_id, index)
+
+    def delete_document(self, conversation_id: str, document_id: str):
+        """Rebuild the conversation's index without one document's chunks."""
+        with self._lock:
+            index = self._get(conversation_id)
+            if index is None:
+                return
+            kept = [r for r in index.records if (r.get("metadata") or {}).get("document_id") != document_id]
+            if len(kept) == len(index.records):
+                return
+            rebuilt = KeywordIndex(index.k1, index.b)
+            rebuilt.add([r["content"] for r in kept], [r["metadata"] for r in kept])
+            self._save(conversation_id, rebuilt)
+
+    def _save(self, conversation_id: str, index: KeywordIndex):
+        path = self._path(conversation_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index.to_json(), f)
+        os.replace(tmp_path, path)
+        self._loaded[conversation_id] = (os.path.getmtime(path), index)
+
+    def search(self, conversation_id: str, query: str, k: int = 4) -> List[Dict[str, Any]]:
+        start = time.perf_counter()
+        # add() mutates cached indexes in place, so scoring happens under the lock too
+        with self._lock:
+            index = self._get(conversation_id)
+            if index is None:
+                return []
+            results = index.search(query, k)
+        print(f"[KeywordIndex] BM25 over {len(index.records)} chunks in {(time.perf_counter() - start) * 1000:.1f}ms")
+        return results
+
+    def clear(self, conversation_id: str):
+        with self._lock:
+            self._loaded.pop(conversation_id, None)
+            try:
+                os.remove(self._path(conversation_id))
+            except OSError:
+                pass
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = 60) -> List[Dict[str, Any]]:
+    """
+    Merge ranked lists with RRF: score(d) = sum over lists of 1 / (k + rank).
+
+    Chunks are identified by (document_id, chunk_index) when they carry a
+    document_id, otherwise by content (legacy rows may have a chunk_index
+    without a document_id, and indexes restart at 0 in every document).
+    """
+    fused: Dict[Any, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            metadata = doc.get("metadata") or {}
+            if metadata.get("document_id") is None:
+                key = doc["content"]
+            else:
+                key = (metadata["document_id"], metadata.get("chunk_index"))
+            entry = fused.setdefault(key, {**doc, "rrf_score": 0.0})
+            entry["rrf_score"] += 1.0 / (k + rank)
+            for field in ("similarity", "bm25"):
+                if field in doc:
+                    entry[field] = doc[field]
+    return sorted(fused.values(), key=lambda doc: doc["rrf_score"], reverse=True)
+
+
+def is_keyword_query(query: str) -> bool:
+    """
+    Heuristic for lookups that need no semantic match: a query that is only a
+    quoted phrase, or a few identifiers (digits or joined codes like "HR-101").
+    A question that merely quotes a word is not one.
+    """
+    stripped = query.strip()
+    if len(stripped) > 2 and stripped[0] == stripped[-1] == '"' and '"' not in stripped[1:-1]:
+        return True
+    terms = tokenize(query)
+    return 0 < len(terms) <= 3 and all(any(c.isdigit() for c in t) or re.search(r"[-_./]", t) for t in terms)
+
+
+# Global singleton (created lazily)
+_keyword_store: Optional[KeywordIndexStore] = None
+
+
+def get_keyword_store() -> KeywordIndexStore:
+    """Get or create the keyword index store."""
+    global _keyword_store
+    if _keyword_store is None:
+        _keyword_store = KeywordIndexStore(settings.keyword_index_path)
+    return _keyword_store
@@ -0,0 +1,286 @@
+"""
+Latency-aware routing across chat models.
+
+ModelHealth keeps rolling latency and error samples per model. Streamed
+requests are timed to the first token; non-streamed (ainvoke) requests to the
+full completion, in a separate window so they don't skew the streaming p95. RoutedLLM wraps a primary model with hedging and fallback:
+
+- if the primary hasn't answered by its p95 latency, the same request is sent
+  to the healthiest fallback model; the first reply wins and the other
+  request is cancelled
+- if the primary fails (e.g. 429 on a :free model), the fallback is tried
+  right away instead of returning an error
+- a model that fails repeatedly is taken out of rotation for a cooldown
+
+CoalescedLLM wraps any chat model (routed or not) so identical concurrent
+ainvoke/astream calls share one provider request.
+"""
+import time
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.single_flight import single_flight, request_key
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ModelHealth:
+    """Rolling latency and error statistics per model."""
+
+    def __init__(self, window: int = 50, failure_threshold: int = 3, cooldown_seconds: float = 60.0):
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._latencies: Dict[str, deque] = {}  # Time to first token (astream)
+        self._invoke_latencies: Dict[str, deque] = {}  # Time to full completion (ainvoke)
+        self._outcomes: Dict[str, deque] = {}
+        self._consecutive_failures: Dict[str, int] = {}
+        self._cooldown_until: Dict[str, float] = {}
+        self.hedges = 0  # Hedged requests sent
+        self.hedge_wins = 0  # Hedged requests that answered first
+        self.fallbacks = 0  # Fallbacks after a failed or unavailable primary
+        self.cancelled = 0  # Requests cancelled because the caller went away
+
+    def record(self, model: str, latency: Optional[float], ok: bool, invoke: bool = False):
+        self._outcomes.setdefault(model, deque(maxlen=self.window)).append(ok)
+        if ok:
+            latencies = self._invoke_latencies if invoke else self._latencies
+            latencies.setdefault(model, deque(maxlen=self.window)).append(latency)
+            self._consecutive_failures[model] = 0
+            return
+
+        failures = self._consecutive_failures.get(model, 0) + 1
+        self._consecutive_failures[model] = failures
+        if failures >= self.failure_threshold:
+            self._cooldown_until[model] = time.monotonic() + self.cooldown_seconds
+            self._consecutive_failures[model] = 0
+            print(f"[LLMRouting] {model} failed {failures} times in a row, "
+                  f"out of rotation for {self.cooldown_seconds:g}s")
+
+    def is_available(self, model: str) -> bool:
+        return time.monotonic() >= self._cooldown_until.get(model, 0.0)
+
+    def percentile(self, model: str, fraction: float, invoke: bool = False) -> Optional[float]:
+        latencies = (self._invoke_latencies if invoke else self._latencies).get(model)
+        if not latencies or len(latencies) < settings.llm_hedge_min_samples:
+            return None
+        return _percentile(list(latencies), fraction)
+
+    def error_rate(self, model: str) -> float:
+        outcomes = self._outcomes.get(model)
+        if not outcomes:
+            return 0.0
+        return 1.0 - sum(outcomes) / len(outcomes)
+
+    def hedge_delay(self, model: str, invoke: bool = False) -> float:
+        """Seconds to wait for the primary before hedging: its p95, or a default until enough samples exist."""
+        p95 = self.percentile(model, 0.95, invoke)
+        if p95 is None:
+            return settings.llm_hedge_delay_seconds
+        return max(settings.llm_hedge_min_delay_seconds, p95)
+
+    def rank(self, models: List[str]) -> List[str]:
+        """Available models, lowest error rate then lowest p50 first."""
+        def key(model: str) -> Tuple[float, float]:
+            p50 = self.percentile(model, 0.5)
+            return self.error_rate(model), p50 if p50 is not None else settings.llm_hedge_delay_seconds
+        return sorted((m for m in models if self.is_available(m)), key=key)
+
+    def stats(self) -> Dict[str, Any]:
+        models = {}
+        for model in set(self._outcomes) | set(self._cooldown_until):
+            p50, p95 = self.percentile(model, 0.5), self.percentile(model, 0.95)
+            invoke_p95 = self.percentile(model, 0.95, invoke=True)
+            models[model] = {
+                "samples": len(self._outcomes.get(model, ())),
+                "p50_ms": round(p50 * 1000) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000) if p95 is not None else None,
+                "invoke_p95_ms": round(invoke_p95 * 1000) if invoke_p95 is not None else None,
+                "error_rate": round(self.error_rate(model), 3),
+                "available": self.is_available(model),
+            }
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "cancelled": self.cancelled,
+            "models": models,
+        }
+
+
+# Global health tracker
+model_health = ModelHealth(
+    window=settings.llm_health_window,
+    failure_threshold=settings.llm_failure_threshold,
+    cooldown_seconds=settings.llm_cooldown_seconds
+)
+
+
+async def _single(coro) -> AsyncIterator[Any]:
+    """Adapt a coroutine to a one-item async iterator so invoke and stream race the same way."""
+    yield await coro
+
+
+class _Candidate:
+    """One model's attempt at a request."""
+
+    def __init__(self, model: str, stream: AsyncIterator[Any], hedge: bool = False):
+        self.model = model
+        self.stream = stream
+        self.hedge = hedge
+        self.started = time.perf_counter()
+        self.first = asyncio.ensure_future(stream.__anext__())
+
+    async def close(self):
+        self.first.cancel()
+        await asyncio.gather(self.first, return_exceptions=True)
+        try:
+            await self.stream.aclose()
+        except Exception:
+            pass
+
+
+class RoutedLLM:
+    """
+    Chat model wrapper adding hedging and fallback around ainvoke/astream.
+
+    Args:
+        model: Requested (primary) model name
+        fallbacks: Candidate fallback model names, in preference order
+        factory: Returns the underlying chat model for a model name
+    """
+
+    def __init__(self, model: str, fallbacks: List[str], factory: Callable[[str], Any], bound: Any = None):
+        self.model = model
+        self.fallbacks = [m for m in fallbacks if m != model]
+        self.factory = factory
+        self.bound = bound  # Bound tools, part of the request identity
+
+    def bind_tools(self, tools, **kwargs) -> "RoutedLLM":
+        factory = self.factory
+        return RoutedLLM(self.model, self.fallbacks, lambda name: factory(name).bind_tools(tools, **kwargs),
+                         bound=(tools, kwargs))
+
+    def _order(self) -> Tuple[str, Optional[str]]:
+        """(primary, fallback) for this request."""
+        ranked = model_health.rank(self.fallbacks)
+        if model_health.is_available(self.model):
+            return self.model, ranked[0] if ranked else None
+        if ranked:
+            print(f"[LLMRouting] {self.model} is cooling down, using {ranked[0]}")
+            model_health.fallbacks += 1
+            return ranked[0], ranked[1] if len(ranked) > 1 else None
+        return self.model, None  # Nothing else available; try anyway
+
+    async def _race(self, open_stream: Callable[[Any], AsyncIterator[Any]],
+                    invoke: bool = False) -> Tuple[_Candidate, Any]:
+        """
+        Get the first item from the primary, hedging or falling back as needed.
+
+        Returns the winning candidate and its first item; the other request
+        is cancelled. If the caller is cancelled, every outstanding request is.
+        invoke marks a full completion, timed in its own latency window.
+        """
+        primary, fallback = self._order()
+        candidates = [_Candidate(primary, open_stream(self.factory(primary)))]
+        hedge_delay = model_health.hedge_delay(primary, invoke)
+        first_error: Optional[BaseException] = None
+        deadline = time.perf_counter() + hedge_delay
+
+        try:
+            while candidates:
+                timeout = None
+                if fallback is not None and len(candidates) == 1:
+                    timeout = max(0.0, deadline - time.perf_counter())
+                done, _ = await asyncio.wait([c.first for c in candidates], timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Primary is slower than its p95: hedge
+                    print(f"[LLMRouting] {primary} slower than {hedge_delay:.1f}s, hedging with {fallback}")
+                    model_health.hedges += 1
+                    candidates.append(_Candidate(fallback, open_stream(self.factory(fallback)), hedge=True))
+                    fallback = None
+                    continue
+
+                for candidate in [c for c in candidates if c.first in done]:
+                    latency = time.perf_counter() - candidate.started
+                    error = candidate.first.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        model_health.record(candidate.model, latency, ok=True, invoke=invoke)
+                        for other in candidates:
+                            if other is not candidate:
+                                await other.close()
+                        if candidate.hedge:
+                            model_health.hedge_wins += 1
+                        return candidate, None if error is not None else candidate.first.result()
+
+                    print(f"[LLMRouting] {candidate.model} failed: {str(error)[:200]}")
+                    model_health.record(candidate.model, None, ok=False)
+                    first_error = first_error or error
+                    candidates.remove(candidate)
+                    if not candidates and fallback is not None:
+                        # Primary failed before the hedge fired: fall back now
+                        model_health.fallbacks += 1
+                        candidates.append(_Candidate(fallback, open_stream(self.factory(fallback))))
+                        fallback = None
+        except asyncio.CancelledError:
+            # The caller went away (e.g. the client disconnected): abort the provider requests
+            model_health.cancelled += 1
+            for candidate in candidates:
+                await candidate.close()
+            raise
+
+        raise first_error
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        winner, result = await self._race(lambda llm: _single(llm.ainvoke(input, config, **kwargs)), invoke=True)
+        await winner.stream.aclose()
+        return result
+
+    async def astream(self, input, config=None, **kwargs) -> AsyncIterator[Any]:
+        winner, first = await self._race(lambda llm: llm.astream(input, config, **kwargs))
+        if first is None:
+            return
+        try:
+            yield first
+            async for chunk in winner.stream:
+                yield chunk
+        except asyncio.CancelledError:
+            model_health.cancelled += 1
+            raise
+        finally:
+            await winner.stream.aclose()
+
+
+class CoalescedLLM:
+    """
+    Chat model wrapper sharing identical in-flight ainvoke/astream calls.
+
+    Args:
+        model: Model name, part of the request identity
+        llm: Underlying chat model (or RoutedLLM)
+    """
+
+    def __init__(self, model: str, llm: Any, bound: Any = None):
+        self.model = model
+        self.llm = llm
+        self.bound = bound  # Bound tools, part of the request identity
+
+    def bind_tools(self, tools, **kwargs) -> "CoalescedLLM":
+        return CoalescedLLM(self.model, self.llm.bind_tools(tools, **kwargs), bound=(tools, kwargs))
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        key = ("llm", request_key(self.model, self.bound, input, kwargs))
+        return await single_flight.do(key, lambda: self.llm.ainvoke(input, config, **kwargs))
+
+    async def astream(self, input, config=None, **kwargs) -> AsyncIterator[Any]:
+        # Followers replay the leader's chunks from the start
+        key = ("llm-stream", request_key(self.model, self.bound, input, kwargs))
+        async for chunk in single_flight.stream(key, lambda: self.llm.astream(input, config, **kwargs)):
+            yield chunk
@@ -16,9 +16,23 @@ except Exception as e:
     ChatOpenAI = None
     BaseChatModel = object  # Dummy base class
 
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
 from app.core.config import settings
+from app.core.llm_routing import RoutedLLM, CoalescedLLM
 from fastapi import HTTPException
 
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except Exception:
+    HTTP2_AVAILABLE = False
+
 
 OPENROUTER_MODELS = {
     "meta-llama/llama-3.3-70b-instruct:free",
@@ -28,9 +42,200 @@ OPENROUTER_MODELS = {
     "nousresearch/hermes-3-llama-3.1-405b:free",
 }
 
+# Fallback candidates for hedging, in preference order
+FALLBACK_MODELS = [
+    "meta-llama/llama-3.3-70b-instruct:free",
+    "mistralai/mistral-small-3.1-24b-instruct:free",
+    "qwen/qwen3-next-80b-a3b-instruct:free",
+    "google/gemma-3-12b-it:free",
+]
+
+class _CountedStream(httpx.AsyncByteStream):
+    """Response body that tells its transport when it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, transport: "_CountingTransport"):
+        self._stream = stream
+        self._transport = transport
+        self._closed = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for part in self._stream:
+            yield part
+
+    async def aclose(self):
+        if not self._closed:
+            self._closed = True
+            self._transport.finished()
+        await self._stream.aclose()
+
+
+class _CountingTransport(httpx.AsyncBaseTransport):
+    """Connection-pooling transport that counts requests until their response is closed."""
+
+    def __init__(self, **kwargs):
+        self._transport = httpx.AsyncHTTPTransport(**kwargs)
+        self.in_flight = 0
+        self.last_active = time.monotonic()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        self.last_active = time.monotonic()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self.finished()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_CountedStream(response.stream, self),
+            extensions=response.extensions,
+        )
+
+    def finished(self):
+        self.in_flight -= 1
+        self.last_active = time.monotonic()
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class LLMClientPool:
+    """
+    Reuses chat model clients across requests.
+
+    Clients are keyed by (provider, model, settings) and share one pooled
+    httpx.AsyncClient per provider endpoint, so keep-alive connections (HTTP/2
+    when h2 is installed) survive between requests instead of paying a TLS
+    handshake each time. The pool is bounded (LRU) and evicts clients idle
+    longer than idle_seconds.
+
+    A model handed out earlier may still be using an endpoint's HTTP client
+    after it is evicted, so a client nothing cached uses is only retired:
+    it is closed once no request is in flight on it and none has started for
+    idle_seconds, and is reused if its endpoint is needed again before then.
+    """
+
+    def __init__(self, max_size: int = 32, idle_seconds: float = 600.0, max_connections: int = 100):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.max_connections = max_connections
+        self._llms: "OrderedDict[Tuple, Tuple[Any, float]]" = OrderedDict()
+        self._http_clients: Dict[Tuple, Tuple[httpx.AsyncClient, _CountingTransport]] = {}
+        self._retired: Dict[Tuple, Tuple[httpx.AsyncClient, _CountingTransport]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _loop_id() -> Optional[int]:
+        # httpx async clients must not be shared across event loops
+        try:
+            return id(asyncio.get_running_loop())
+        except RuntimeError:
+            return None
+
+    def _http_client(self, base_url: str, timeout: float, loop_id: Optional[int]) -> httpx.AsyncClient:
+        key = (base_url, timeout, loop_id)
+        entry = self._http_clients.get(key) or self._retired.pop(key, None)
+        if entry is None or entry[0].is_closed:
+            transport = _CountingTransport(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=20)
+            )
+            entry = (httpx.AsyncClient(transport=transport, timeout=timeout), transport)
+            print(f"[ModelRouter] New HTTP client for {base_url} (http2={HTTP2_AVAILABLE})")
+        self._http_clients[key] = entry
+        return entry[0]
+
+    def get(self, provider: str, model_name: str, base_url: str, api_key: str, **params) -> Any:
+        """Get a cached client or create one."""
+        now = time.monotonic()
+        self._evict(now)
+
+        loop_id = self._loop_id()
+        key = (provider, model_name, base_url, api_key, loop_id, tuple(sorted(params.items())))
+        cached = self._llms.get(key)
+        if cached is not None:
+            self.hits += 1
+            self._llms[key] = (cached[0], now)
+            self._llms.move_to_end(key)
+            return cached[0]
+
+        self.misses += 1
+        llm = ChatOpenAI(
+            model=model_name,
+            base_url=base_url,
+            api_key=api_key,
+            http_async_client=self._http_client(base_url, params.get("timeout", 60), loop_id),
+            **params
+        )
+        self._llms[key] = (llm, now)
+        while len(self._llms) > self.max_size:
+            self._llms.popitem(last=False)
+            self.evictions += 1
+        return llm
+
+    def _evict(self, now: float):
+        """Drop idle clients, retire HTTP clients nothing cached uses, close drained ones."""
+        for key in [k for k, (_, last_used) in self._llms.items() if now - last_used > self.idle_seconds]:
+            del self._llms[key]
+            self.evictions += 1
+
+        in_use = {(key[2], dict(key[5]).get("timeout", 60), key[4]) for key in self._llms}
+        for key in [k for k in self._http_clients if k not in in_use]:
+            self._retired[key] = self._http_clients.pop(key)
+
+        drained = [
+            key for key, (_, transport) in self._retired.items()
+            if transport.in_flight == 0 and now - transport.last_active > self.idle_seconds
+        ]
+        for key in drained:
+            client, _ = self._retired.pop(key)
+            try:
+                asyncio.get_running_loop().create_task(client.aclose())
+            except RuntimeError:
+                pass  # No loop to close on; connections are dropped with the client
+
+    def in_flight_requests(self) -> int:
+        return sum(transport.in_flight for _, transport in [*self._http_clients.values(), *self._retired.values()])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._llms),
+            "http_clients": len(self._http_clients),
+            "retired_http_clients": len(self._retired),
+            "in_flight_requests": self.in_flight_requests(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "http2": HTTP2_AVAILABLE,
+        }
+
+    async def aclose(self):
+        """Close all HTTP clients (call on application shutdown)."""
+        for client, _ in [*self._http_clients.values(), *self._retired.values()]:
+            await client.aclose()
+        self._http_clients.clear()
+        self._retired.clear()
+        self._llms.clear()
+
+
+# Global client pool
+llm_pool = LLMClientPool(
+    max_size=settings.llm_pool_size,
+    idle_seconds=settings.llm_pool_idle_seconds
+)
+
+
 def get_llm(model_name: str) -> BaseChatModel:
     """
     Route model requests to the correct provider.
+
+    Clients come from llm_pool, so repeated requests reuse connections.
+    OpenRouter models are wrapped in RoutedLLM (hedging and fallback) unless
+    LLM_ROUTING is disabled. Every model is wrapped in CoalescedLLM, so
+    identical concurrent calls share one request.
     """
 
     # 1️⃣ Local LLaMA (vLLM)
@@ -39,15 +244,16 @@ def get_llm(model_name: str) -> BaseChatModel:
         raise HTTPException(status_code=500, detail="AI Model service unavailable due to missing dependencies")
 
     if model_name.startswith("meta-llama/Llama-") and "local" in model_name:
-        return ChatOpenAI(
-            model=model_name,
+        return CoalescedLLM(model_name, llm_pool.get(
+            "local",
+            model_name,
             base_url=settings.local_llm_base_url,
             api_key=settings.local_llm_api_key or "dummy",
             temperature=0.2,
             timeout=30,
             max_retries=1,
             streaming=False,
-        )
+        ))
 
     # 2️⃣ OpenRouter models
     # If it's a known model or looks like a valid OpenRouter ID (vendor/model), use it.
@@ -56,8 +262,16 @@ def get_llm(model_name: str) -> BaseChatModel:
          print(f"[ModelRouter] Warning: Invalid model '{model_name}'. Falling back.")
          model_name = "meta-llama/llama-3.3-70b-instruct:free"
 
-    return ChatOpenAI(
-        model=model_name,
+    if settings.llm_routing:
+        # Hedge slow requests and fall back on failures to other OpenRouter models
+        return CoalescedLLM(model_name, RoutedLLM(model_name, FALLBACK_MODELS, _openrouter_llm))
+    return CoalescedLLM(model_name, _openrouter_llm(model_name))
+
+
+def _openrouter_llm(model_name: str) -> BaseChatModel:
+    return llm_pool.get(
+        "openrouter",
+        model_name,
         base_url=settings.openrouter_base_url,
         api_key=settings.openrouter_api_key,
         temperature=0.2,
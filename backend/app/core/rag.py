@@ -1,71 +1,33 @@
 """
-Enhanced RAG implementation with pypdf and HuggingFace API embeddings.
+Enhanced RAG implementation with pypdf and batched OpenRouter embeddings.
 No local ML dependencies or DLLs required.
 """
 import os
-from typing import List, Optional
+import math
+import uuid
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 from datetime import datetime
-from io import BytesIO
-from pypdf import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from app.core.config import settings
+from app.core.embeddings import OpenRouterEmbeddings
+from app.core.embedding_cache import EmbeddingCache, CachedEmbeddings
+from app.core.vector_store import get_vector_store
+from app.core.document_loader import iter_document_pages
+from app.core.keyword_index import get_keyword_store, is_keyword_query, reciprocal_rank_fusion
+
+CHUNK_SIZE = 3000
+CHUNK_OVERLAP = 600
 
 # Global singleton for embedding model
 _embedding_model = None
 
-# Custom embedding class using OpenAI API via OpenRouter
-class OpenRouterEmbeddings:
-    """Direct HTTP calls to OpenRouter for OpenAI embeddings."""
-    
-    def __init__(self, api_key: str, model: str = "openai/text-embedding-3-small"):
-        self.api_key = api_key
-        self.model = model
-        self.api_url = "https://openrouter.ai/api/v1/embeddings"
-    
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Embed a list of documents."""
-        import httpx
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        embeddings = []
-        for text in texts:
-            response = httpx.post(
-                self.api_url,
-                headers=headers,
-                json={
-                    "model": self.model,
-                    "input": text
-                },
-                timeout=30.0
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                # OpenAI format: {data: [{embedding: [...]}]}
-                if "data" in result and len(result["data"]) > 0:
-                    embedding = result["data"][0]["embedding"]
-                    embeddings.append(embedding)
-                else:
-                    raise ValueError(f"Unexpected response format: {result}")
-            else:
-                raise ValueError(f"OpenRouter API error: {response.status_code} - {response.text}")
-        
-        return embeddings
-    
-    def embed_query(self, text: str) -> List[float]:
-        """Embed a single query."""
-        return self.embed_documents([text])[0]
-
-
 def get_embedding_model():
     """
     Get or create the singleton embedding model.
-    Uses OpenAI embeddings via OpenRouter (text-embedding-3-small, 1536 dims).
+    Uses OpenAI embeddings via OpenRouter (text-embedding-3-small, 1536 dims),
+    fronted by a content-addressed cache (LRU + SQLite).
     """
     global _embedding_model
     if _embedding_model is not None:
@@ -81,11 +43,21 @@ def get_embedding_model():
         
         print(f"[RAG] Using OpenRouter API key: {api_key[:10]}...")
         
-        # Use custom implementation
-        _embedding_model = OpenRouterEmbeddings(
+        # Use custom batched implementation
+        client = OpenRouterEmbeddings(
             api_key=api_key,
-            model="openai/text-embedding-3-small"
+            model=settings.embedding_model,
+            api_url=f"{settings.openrouter_base_url.rstrip('/')}/embeddings",
+            max_batch_size=settings.embedding_batch_size,
+            max_batch_tokens=settings.embedding_max_batch_tokens,
+            max_batch_bytes=settings.embedding_max_batch_bytes,
+            max_concurrency=settings.embedding_concurrency,
+        )
+        cache = EmbeddingCache(
+            max_entries=settings.embedding_cache_size,
+            db_path=settings.embedding_cache_path or None,
         )
+        _embedding_model = CachedEmbeddings(client, cache)
         print(f"[RAG] Loaded OpenAI embeddings via OpenRouter (1536 dims)")
         return _embedding_model
     except Exception as e:
@@ -98,6 +70,7 @@ def get_embedding_model():
 def process_document(file_content: bytes, filename: str) -> str:
     """
     Extract text from a document using pypdf.
+    Pages are extracted in parallel; see app.core.document_loader.
     
     Args:
         file_content: Raw file bytes
@@ -108,18 +81,13 @@ def process_document(file_content: bytes, filename: str) -> str:
     """
     if filename.lower().endswith('.pdf'):
         try:
-            # Open PDF with pypdf
-            pdf = PdfReader(BytesIO(file_content))
-            text = ""
+            parts = []
+            for page_text in iter_document_pages(file_content, filename):
+                parts.append(page_text)
+                parts.append("\n\n")
+            text = "".join(parts)
             
-            for page_num, page in enumerate(pdf.pages):
-                page_text = page.extract_text() or ""
-                text += page_text + "\n\n"
-                
-                if page_num % 10 == 0:
-                    print(f"[RAG] Processed page {page_num + 1}/{len(pdf.pages)}")
-            
-            print(f"[RAG] Extracted {len(text)} characters from {len(pdf.pages)} pages")
+            print(f"[RAG] Extracted {len(text)} characters from {len(parts) // 2} pages")
             return text
             
         except Exception as e:
@@ -127,103 +95,292 @@ def process_document(file_content: bytes, filename: str) -> str:
             return ""
     else:
         # Plain text file
-        try:
-            return file_content.decode('utf-8')
-        except:
-            return file_content.decode('latin-1')
+        return next(iter_document_pages(file_content, filename))
+
+
+def _text_splitter() -> RecursiveCharacterTextSplitter:
+    """Split text into chunks (3000 chars with 600 overlap)."""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+    )
 
 
-def create_vector_store(conversation_id: str, text: str) -> bool:
+async def achunk_pages(pages: AsyncIterator[str]) -> AsyncIterator[str]:
     """
-    Create/Update Supabase vector store for a conversation.
-    Limits to maximum 20 chunks.
-    Uses direct REST API to avoid dependency issues.
+    Chunk a stream of page texts without materializing the whole document.
+    
+    Pages are buffered until a few chunks' worth of text is available; every
+    chunk except the last is emitted, and the last is carried over so chunks
+    spanning page boundaries come out the same as with whole-text splitting.
+    
+    Args:
+        pages: Async iterator of page texts
+        
+    Yields:
+        Text chunks
+    """
+    splitter = _text_splitter()
+    buffer: List[str] = []
+    buffered = 0
+    
+    async for page_text in pages:
+        buffer.append(page_text + "\n\n")
+        buffered += len(page_text) + 2
+        if buffered < CHUNK_SIZE * 4:
+            continue
+        
+        chunks = splitter.split_text("".join(buffer))
+        for chunk in chunks[:-1]:
+            yield chunk
+        buffer = chunks[-1:]
+        buffered = sum(len(part) for part in buffer)
+    
+    if buffer:
+        for chunk in splitter.split_text("".join(buffer)):
+            yield chunk
+
+
+def _build_hierarchy(
+    conversation_id: str,
+    document_id: str,
+    chunks: List[str],
+    embeddings: List[List[float]],
+    chunk_offset: int = 0
+) -> Tuple[List[str], List[List[float]], List[Dict[str, Any]]]:
+    """
+    Group consecutive chunks into sections and add one summary row per section.
+    
+    The section vector is the normalized centroid of its chunk vectors, so a
+    query can pick the best sections first and then search only their chunks.
+    chunk_offset is the document position of chunks[0] (a multiple of the
+    section size when a document is stored in windows).
+    
+    Returns:
+        (contents, vectors, metadatas) for all chunk and section rows
+    """
+    created_at = datetime.utcnow().isoformat()
+    section_size = max(1, settings.rag_section_size)
+    contents: List[str] = []
+    vectors: List[List[float]] = []
+    metadatas: List[Dict[str, Any]] = []
+    
+    for start in range(0, len(chunks), section_size):
+        section_id = f"{document_id}:{(chunk_offset + start) // section_size}"
+        section_chunks = chunks[start:start + section_size]
+        section_vectors = embeddings[start:start + section_size]
+        
+        for offset, (chunk, vector) in enumerate(zip(section_chunks, section_vectors)):
+            contents.append(chunk)
+            vectors.append(vector)
+            metadatas.append({
+                "conversation_id": conversation_id,
+                "document_id": document_id,
+                "level": "chunk",
+                "section_id": section_id,
+                "chunk_index": chunk_offset + start + offset,
+                "created_at": created_at
+            })
+        
+        centroid = [sum(values) / len(section_vectors) for values in zip(*section_vectors)]
+        norm = math.sqrt(sum(value * value for value in centroid)) or 1.0
+        contents.append(" … ".join(chunk[:200] for chunk in section_chunks))
+        vectors.append([value / norm for value in centroid])
+        metadatas.append({
+            "conversation_id": conversation_id,
+            "document_id": document_id,
+            "level": "section",
+            "section_id": section_id,
+            "chunk_start": chunk_offset + start,
+            "chunk_count": len(section_chunks),
+            "created_at": created_at
+        })
+    
+    return contents, vectors, metadatas
+
+
+async def _search_hierarchical(conversation_id: str, query_embedding: List[float], k: int) -> List[Dict[str, Any]]:
+    """
+    Two-stage retrieval: best sections first, then chunks inside them.
+    
+    Chunks stored before sections existed have no section_id, so a flat
+    search runs alongside and its unsectioned chunks compete with the
+    section candidates (it is also the whole result when no sections exist).
+    """
+    store = get_vector_store()
+    sections, flat = await asyncio.gather(
+        store.search(conversation_id, query_embedding, settings.rag_top_sections, filter={"level": "section"}),
+        store.search(conversation_id, query_embedding, k * 2)
+    )
+    flat_chunks = [doc for doc in flat if (doc.get("metadata") or {}).get("level") != "section"]
+    if not sections:
+        return flat_chunks[:k]
+    
+    per_section = await asyncio.gather(*(
+        store.search(
+            conversation_id, query_embedding, k,
+            filter={"level": "chunk", "section_id": section["metadata"]["section_id"]}
+        )
+        for section in sections
+    ))
+    unsectioned = [doc for doc in flat_chunks if not (doc.get("metadata") or {}).get("section_id")]
+    candidates = [doc for docs in per_section for doc in docs] + unsectioned
+    candidates.sort(key=lambda doc: doc.get('similarity', 0), reverse=True)
+    print(f"[RAG] Searched {len(sections)} sections, {len(candidates)} candidate chunks "
+          f"({len(unsectioned)} without a section)")
+    return candidates[:k]
+
+
+async def _single_page(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+async def aingest_pages(
+    conversation_id: str,
+    pages: AsyncIterator[str],
+    document_id: Optional[str] = None,
+    min_chars: int = 0,
+    progress: Optional[Callable[..., None]] = None
+) -> Dict[str, Any]:
+    """
+    Chunk, embed and store a stream of page texts.
+    Chunking starts while pages are still being extracted, and chunks are
+    embedded and stored in windows of settings.rag_ingest_window, so memory
+    is bounded by the window rather than the document. Every chunk is kept
+    and indexed under a section (see _build_hierarchy). If any window fails
+    (or the ingestion is cancelled), the windows already stored are deleted.
     
     Args:
         conversation_id: Conversation ID
-        text: Document text
+        pages: Async iterator of page texts
+        document_id: Optional ID for the document (generated if omitted)
+        min_chars: Reject documents with less extracted text than this
+        progress: Optional callback progress(stage, **counts), called as the
+            pipeline moves through extracting/embedding/storing
         
     Returns:
-        Success status
+        Dict with success status, chunk count and extracted text length
     """
     embeddings_model = get_embedding_model()
     if not embeddings_model:
         print("[RAG] Embedding model not available")
-        return False
-        
-    try:
-        # Split text into chunks (3000 chars with 600 overlap)
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=3000,
-            chunk_overlap=600,
-            length_function=len,
+        return {'success': False, 'error': 'Embedding model not available', 'text_length': 0}
+    
+    text_length = 0
+    report = progress or (lambda stage, **counts: None)
+    document_id = document_id or str(uuid.uuid4())
+    store = get_vector_store()
+    # Windows cover whole sections, so section ids match a single-pass build
+    section_size = max(1, settings.rag_section_size)
+    window_size = section_size * max(1, settings.rag_ingest_window // section_size)
+    stored = 0
+    
+    async def counted(source: AsyncIterator[str]) -> AsyncIterator[str]:
+        nonlocal text_length
+        page_count = 0
+        async for page_text in source:
+            text_length += len(page_text)
+            page_count += 1
+            report("extracting", pages=page_count)
+            yield page_text
+    
+    async def store_window(chunks: List[str]):
+        nonlocal stored
+        report("embedding", chunks=stored + len(chunks))
+        embeddings_list = await embeddings_model.aembed_documents(chunks)
+        report("storing", embedded=stored + len(embeddings_list))
+        
+        contents, vectors, metadatas = _build_hierarchy(
+            conversation_id, document_id, chunks, embeddings_list, chunk_offset=stored
         )
-        chunks = text_splitter.split_text(text)
-        
-        if not chunks:
-            print("[RAG] No chunks created from text")
-            return False
-        
-        # Limit to 20 chunks
-        if len(chunks) > 20:
-            print(f"[RAG] Limiting from {len(chunks)} to 20 chunks")
-            # Take evenly distributed chunks
-            step = len(chunks) / 20
-            chunks = [chunks[int(i * step)] for i in range(20)]
-        
-        print(f"[RAG] Processing {len(chunks)} chunks for conversation {conversation_id}")
-        
-        # Generate embeddings via HuggingFace API
-        print("[RAG] Generating embeddings via HuggingFace API...")
-        embeddings_list = embeddings_model.embed_documents(chunks)
-        
-        # Use httpx for direct REST API calls
-        import httpx
-        
-        headers = {
-            "apikey": settings.supabase_key,
-            "Authorization": f"Bearer {settings.supabase_key}",
-            "Content-Type": "application/json",
-            "Prefer": "return=minimal"
-        }
-        
-        # Insert chunks with embeddings
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings_list)):
-            data = {
-                "conversation_id": conversation_id,
-                "content": chunk,
-                "embedding": embedding,
-                "metadata": {
-                    "chunk_index": i,
-                    "created_at": datetime.utcnow().isoformat()
-                }
-            }
-            
-            response = httpx.post(
-                f"{settings.supabase_url}/rest/v1/documents",
-                headers=headers,
-                json=data,
-                timeout=30.0
-            )
-            
-            if response.status_code not in [200, 201]:
-                print(f"[RAG] Error inserting chunk {i}: {response.status_code} - {response.text}")
-                return False
-        
-        print(f"[RAG] Successfully stored {len(chunks)} chunks")
-        return True
-        
-    except Exception as e:
+        if not await store.add(conversation_id, document_id, contents, vectors, metadatas):
+            raise RuntimeError("Failed to store chunks")
+        
+        # Keyword index over chunk rows for hybrid retrieval
+        if settings.rag_hybrid:
+            chunk_rows = [(c, m) for c, m in zip(contents, metadatas) if m["level"] == "chunk"]
+            try:
+                await asyncio.to_thread(
+                    get_keyword_store().add,
+                    conversation_id,
+                    [c for c, _ in chunk_rows],
+                    [m for _, m in chunk_rows]
+                )
+            except Exception as e:
+                print(f"[RAG] Keyword indexing failed (vector search still available): {e}")
+        
+        stored += len(chunks)
+        report("storing", stored=stored)
+    
+    try:
+        window: List[str] = []
+        async for chunk in achunk_pages(counted(pages)):
+            window.append(chunk)
+            # The first window waits until the document is known to have enough text
+            if len(window) >= window_size and text_length >= min_chars:
+                await store_window(window)
+                window = []
+        
+        if text_length < min_chars or not (stored or window):
+            print(f"[RAG] Insufficient text extracted ({text_length} chars)")
+            return {'success': False, 'error': 'Could not extract sufficient text', 'text_length': text_length}
+        if window:
+            await store_window(window)
+        
+        print(f"[RAG] Successfully stored {stored} chunks for conversation {conversation_id}")
+        return {'success': True, 'chunks': stored, 'text_length': text_length}
+        
+    except BaseException as e:
+        if stored:
+            # All-or-nothing per document: drop the windows that already landed
+            await asyncio.shield(_delete_document(conversation_id, document_id))
+        if not isinstance(e, Exception):
+            raise
         print(f"[RAG] Error creating vector store: {e}")
         import traceback
         traceback.print_exc()
-        return False
+        return {'success': False, 'error': str(e), 'text_length': text_length}
 
 
-def get_rag_context(conversation_id: str, query: str, k: int = 4) -> str:
+async def _delete_document(conversation_id: str, document_id: str):
+    """Remove one document from the vector store and keyword index."""
+    try:
+        await get_vector_store().delete_document(conversation_id, document_id)
+        if settings.rag_hybrid:
+            await asyncio.to_thread(get_keyword_store().delete_document, conversation_id, document_id)
+    except Exception as e:
+        print(f"[RAG] Rolling back document {document_id} failed: {e}")
+
+
+async def acreate_vector_store(conversation_id: str, text: str, document_id: Optional[str] = None) -> bool:
+    """
+    Create/Update the vector store for a conversation.
+    Embeddings are batched and requested concurrently; chunks are stored in
+    the configured backend (Supabase or local).
+    
+    Args:
+        conversation_id: Conversation ID
+        text: Document text
+        document_id: Optional ID for the document (generated if omitted)
+        
+    Returns:
+        Success status
+    """
+    result = await aingest_pages(conversation_id, _single_page(text), document_id)
+    return result['success']
+
+
+def create_vector_store(conversation_id: str, text: str, document_id: Optional[str] = None) -> bool:
+    """Sync wrapper around acreate_vector_store for scripts."""
+    return asyncio.run(acreate_vector_store(conversation_id, text, document_id))
+
+
+async def aget_rag_chunks(conversation_id: str, query: str, k: int = 4) -> List[Dict[str, Any]]:
     """
-    Retrieve context from Supabase Vector Store using similarity search.
-    Uses direct REST API calls.
+    Retrieve ranked chunks using hybrid search: BM25 keyword hits fused with
+    vector hits via reciprocal rank fusion. Identifier-style queries
+    (e.g. "HR-101") that the keyword index answers skip the embedding call.
     
     Args:
         conversation_id: Conversation ID
@@ -231,70 +388,77 @@ def get_rag_context(conversation_id: str, query: str, k: int = 4) -> str:
         k: Number of chunks to retrieve
         
     Returns:
-        Retrieved context
+        Chunks (content, metadata, scores), best first
     """
     embeddings_model = get_embedding_model()
-    if not embeddings_model:
-        return ""
+    if not embeddings_model and not settings.rag_hybrid:
+        return []
         
     try:
-        # Generate query embedding via HuggingFace API
-        query_embedding = embeddings_model.embed_query(query)
-        
-        # Use httpx for direct RPC call
-        import httpx
-        
-        headers = {
-            "apikey": settings.supabase_key,
-            "Authorization": f"Bearer {settings.supabase_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # Call match_documents RPC function
-        response = httpx.post(
-            f"{settings.supabase_url}/rest/v1/rpc/match_documents",
-            headers=headers,
-            json={
-                'query_embedding': query_embedding,
-                'match_count': k,
-                'filter': {'conversation_id': conversation_id}
-            },
-            timeout=30.0
-        )
-        
-        if response.status_code != 200:
-            print(f"[RAG] Error querying documents: {response.status_code} - {response.text}")
-            return ""
-        
-        result_data = response.json()
+        keyword_hits = []
+        if settings.rag_hybrid:
+            keyword_hits = await asyncio.to_thread(get_keyword_store().search, conversation_id, query, k * 2)
+        
+        if keyword_hits and (is_keyword_query(query) or not embeddings_model):
+            print(f"[RAG] Keyword query, skipping embedding")
+            result_data = keyword_hits[:k]
+        elif embeddings_model:
+            # Generate query embedding via OpenRouter
+            query_embedding = await embeddings_model.aembed_query(query)
+            vector_hits = await _search_hierarchical(conversation_id, query_embedding, k * 2 if keyword_hits else k)
+            if keyword_hits:
+                result_data = reciprocal_rank_fusion([vector_hits, keyword_hits], settings.rag_rrf_k)[:k]
+            else:
+                result_data = vector_hits
+        else:
+            result_data = []
         
         if not result_data:
             print(f"[RAG] No documents found for conversation {conversation_id}")
-            return ""
+            return []
         
-        # Combine retrieved chunks
         print(f"[RAG] Found {len(result_data)} chunks:")
         for i, doc in enumerate(result_data):
-            score = doc.get('similarity', 0)
+            score = doc.get('rrf_score', doc.get('similarity', doc.get('bm25', 0)))
             content_preview = doc['content'][:100].replace('\n', ' ')
             print(f"[RAG] Chunk {i+1} (Score: {score:.4f}): {content_preview}...")
-            
-        context = "\n\n".join([doc['content'] for doc in result_data])
-        print(f"[RAG] Retrieved {len(result_data)} chunks ({len(context)} chars)")
         
-        return context
+        return result_data
         
     except Exception as e:
         print(f"[RAG] Error retrieving context: {e}")
         import traceback
         traceback.print_exc()
-        return ""
+        return []
 
 
-def clear_vector_store(conversation_id: str) -> bool:
+async def aget_rag_context(conversation_id: str, query: str, k: int = 4) -> str:
+    """
+    Retrieve context as one string (see aget_rag_chunks).
+    
+    Args:
+        conversation_id: Conversation ID
+        query: Search query
+        k: Number of chunks to retrieve
+        
+    Returns:
+        Retrieved context
+    """
+    result_data = await aget_rag_chunks(conversation_id, query, k)
+    context = "\n\n".join([doc['content'] for doc in result_data])
+    if result_data:
+        print(f"[RAG] Retrieved {len(result_data)} chunks ({len(context)} chars)")
+    return context
+
+
+def get_rag_context(conversation_id: str, query: str, k: int = 4) -> str:
+    """Sync wrapper around aget_rag_context for scripts."""
+    return asyncio.run(aget_rag_context(conversation_id, query, k))
+
+
+async def aclear_vector_store(conversation_id: str) -> bool:
     """
     Clear all documents for a conversation.
-    Uses direct REST API calls.
     
     Args:
         conversation_id: Conversation ID
@@ -303,27 +467,17 @@ def clear_vector_store(conversation_id: str) -> bool:
         Success status
     """
     try:
-        import httpx
-        
-        headers = {
-            "apikey": settings.supabase_key,
-            "Authorization": f"Bearer {settings.supabase_key}",
-            "Content-Type": "application/json"
-        }
-        
-        response = httpx.delete(
-            f"{settings.supabase_url}/rest/v1/documents?conversation_id=eq.{conversation_id}",
-            headers=headers,
-            timeout=30.0
-        )
-        
-        if response.status_code in [200, 204]:
+        success = await get_vector_store().clear(conversation_id)
+        await asyncio.to_thread(get_keyword_store().clear, conversation_id)
+        if success:
             print(f"[RAG] Cleared documents for conversation {conversation_id}")
-            return True
-        else:
-            print(f"[RAG] Error clearing documents: {response.status_code}")
-            return False
+        return success
             
     except Exception as e:
         print(f"[RAG] Error clearing vector store: {e}")
         return False
+
+
+def clear_vector_store(conversation_id: str) -> bool:
+    """Sync wrapper around aclear_vector_store for scripts."""
+    return asyncio.run(aclear_vector_store(conversation_id))
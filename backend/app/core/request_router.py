@@ -0,0 +1,76 @@
+"""
+Cheap request routing for chat.
+
+Decides from local signals (enabled tool servers, a keyword intent
+classifier and the image generation flag) whether a message needs the
+planning LLM call at all. Most chats use no tools, so they can go straight
+to a single answer call.
+"""
+import re
+from typing import Dict, List, Tuple
+
+from app.core.config import settings
+
+# Routes
+ROUTE_ANSWER = "answer"  # Answer directly, no planning call
+ROUTE_IMAGE = "image"  # Generate an image from the message, no planning call
+ROUTE_PLAN = "plan"  # Ask the LLM to plan tool calls
+
+# Phrases that signal a request for each tool server
+_SERVER_INTENTS: Dict[str, List[str]] = {
+    "gmail": [
+        "email", "e-mail", "mail", "inbox", "gmail", "unread", "send", "reply",
+        "forward", "draft", "sender", "message from", "messages from",
+    ],
+    "google-calendar": [
+        "calendar", "meeting", "event", "schedule", "appointment", "agenda",
+        "remind", "reschedule", "book", "availability", "free time", "busy",
+        "tomorrow", "next week", "today",
+    ],
+    "notion": ["notion", "page", "note", "notes", "document in", "workspace", "wiki"],
+}
+
+_IMAGE_INTENT_RE = re.compile(
+    r"\b(draw|paint|sketch|illustrate|render)\b"
+    r"|\b(generate|create|make|design|produce)\b.{0,40}\b(image|picture|photo|drawing|illustration|logo|art(work)?|wallpaper|icon)s?\b",
+    re.IGNORECASE
+)
+
+
+def has_image_intent(message: str) -> bool:
+    """True if the message asks for an image to be generated."""
+    return bool(_IMAGE_INTENT_RE.search(message))
+
+
+def _mentions(message: str, phrases: List[str]) -> bool:
+    return any(re.search(rf"\b{re.escape(phrase)}\b", message) for phrase in phrases)
+
+
+def route_request(message: str, enabled_mcps: List[str], image_generation: bool = False) -> Tuple[str, str]:
+    """
+    Choose how to handle a chat message.
+
+    Args:
+        message: User message
+        enabled_mcps: Tool servers enabled for this request
+        image_generation: Image generation already requested via the toggle
+
+    Returns:
+        (route, reason) where route is ROUTE_ANSWER, ROUTE_IMAGE or ROUTE_PLAN
+    """
+    if not settings.chat_fast_path:
+        return ROUTE_PLAN, "fast path disabled"
+
+    lowered = message.lower()
+    matched = [server for server in enabled_mcps if _mentions(lowered, _SERVER_INTENTS.get(server, []))]
+    unknown = [server for server in enabled_mcps if server not in _SERVER_INTENTS]
+    if matched or unknown:
+        return ROUTE_PLAN, f"tool intent for {', '.join(matched + unknown)}"
+
+    # generate_image is the only other tool; the toggle already handled it upstream
+    if not image_generation and has_image_intent(message):
+        return ROUTE_IMAGE, "image intent"
+
+    if enabled_mcps:
+        return ROUTE_ANSWER, "no tool intent"
+    return ROUTE_ANSWER, "no tools enabled"
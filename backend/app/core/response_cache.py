@@ -0,0 +1,160 @@
+"""
+Opt-in semantic cache for chat responses (RESPONSE_CACHE_ENABLED).
+
+Entries are keyed by model, a scope (the conversation and its enabled tool
+servers), the normalized message and a fingerprint of the retrieved context,
+so the same question over the same documents is answered once per
+conversation. Lookup is exact first; on a miss, the message embedding is
+compared with cached entries for the same model, scope and context, and a
+cosine similarity above the threshold counts as a hit. Entries expire after
+a TTL and the cache is LRU-bounded.
+
+Callers must not store responses produced with tools: side-effecting tools
+would not run again on a hit, and read-only tools return live data.
+"""
+import re
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", message.lower()).strip().rstrip("?!. ")
+
+
+def context_fingerprint(context_text: str) -> str:
+    return hashlib.sha256(context_text.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_scope(conversation_id: str, enabled_mcps: List[str]) -> str:
+    """Scope of a cached answer: one conversation with one set of enabled tool servers."""
+    return f"{conversation_id}\x00{','.join(sorted(enabled_mcps))}"
+
+
+class ResponseCache:
+    """LRU + TTL cache of chat responses with exact and embedding-similarity lookup."""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600.0, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(model: str, scope: str, normalized: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{model}\x00{scope}\x00{fingerprint}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def _expire(self, now: float):
+        for key in [k for k, e in self._entries.items() if now - e["created"] > self.ttl_seconds]:
+            del self._entries[key]
+
+    async def _embed(self, message: str) -> Optional[List[float]]:
+        if np is None or self.similarity_threshold >= 1.0:
+            return None
+        try:
+            from app.core.rag import get_embedding_model
+            return await get_embedding_model().aembed_query(message)
+        except Exception as e:
+            print(f"[ResponseCache] Embedding failed, exact lookup only: {e}")
+            return None
+
+    async def aget(self, model: str, scope: str, message: str, context_text: str) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached response.
+
+        Args:
+            model: Model the answer came from
+            scope: cache_scope() of the request
+            message: User message
+            context_text: Packed context sent with the message
+
+        Returns:
+            The stored response dict, or None on a miss
+        """
+        now = time.monotonic()
+        self._expire(now)
+        normalized = normalize_message(message)
+        fingerprint = context_fingerprint(context_text)
+
+        key = self._key(model, scope, normalized, fingerprint)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            print(f"[ResponseCache] Exact hit for '{normalized[:60]}'")
+            return entry["response"]
+
+        candidates = [
+            (k, e) for k, e in self._entries.items()
+            if e["model"] == model and e["scope"] == scope and e["fingerprint"] == fingerprint
+            and e["vector"] is not None
+        ]
+        if candidates:
+            vector = await self._embed(normalized)
+            if vector is not None:
+                query = np.asarray(vector, dtype=np.float32)
+                query /= np.linalg.norm(query) or 1.0
+                similarities = np.stack([e["vector"] for _, e in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    best_key, best_entry = candidates[best]
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    print(f"[ResponseCache] Semantic hit ({similarities[best]:.3f}) for '{normalized[:60]}'")
+                    return best_entry["response"]
+
+        self.misses += 1
+        return None
+
+    async def aput(self, model: str, scope: str, message: str, context_text: str, response: Dict[str, Any]):
+        """Store a response (only for answers produced without tools)."""
+        normalized = normalize_message(message)
+        fingerprint = context_fingerprint(context_text)
+        vector = await self._embed(normalized)
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+
+        key = self._key(model, scope, normalized, fingerprint)
+        self._entries[key] = {
+            "model": model,
+            "scope": scope,
+            "fingerprint": fingerprint,
+            "vector": vector,
+            "response": response,
+            "created": time.monotonic(),
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "enabled": settings.response_cache_enabled,
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Global response cache
+response_cache = ResponseCache(
+    max_entries=settings.response_cache_size,
+    ttl_seconds=settings.response_cache_ttl_seconds,
+    similarity_threshold=settings.response_cache_similarity
+)
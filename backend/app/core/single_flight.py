@@ -0,0 +1,155 @@
+"""
+Request coalescing ("single flight") for outbound calls.
+
+When identical calls are made concurrently (same web search, same query
+embedding, same LLM prompt), only the first one goes to the provider; the
+others attach to its in-flight task and get the same result. The shared task
+is cancelled only when every caller waiting on it has gone away.
+
+Streams are coalesced the same way: one task reads the provider stream and
+every caller iterates the chunks it has buffered, starting from the first.
+"""
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+def request_key(*parts: Any) -> str:
+    """Stable key for a call from its (possibly large) arguments."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8", errors="replace"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class _SharedStream:
+    """Chunks of one in-flight stream, replayed to every caller."""
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        # Wake everyone waiting for the next chunk; later waits use a fresh event
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key."""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, Tuple[asyncio.Task, list]] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+        self.calls = 0  # Calls that reached the provider
+        self.coalesced = 0  # Calls served by another caller's in-flight request
+        self.cancelled = 0  # Shared calls cancelled because every caller went away
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run call() unless an identical call is already in flight, then share its result.
+
+        Args:
+            key: Identity of the call, e.g. ("web", query)
+            call: Zero-argument factory for the coroutine
+        """
+        entry = self._in_flight.get(key)
+        if entry is None or entry[0].done():
+            task = asyncio.ensure_future(call())
+            entry = (task, [0])  # [number of waiting callers]
+            self._in_flight[key] = entry
+            task.add_done_callback(lambda _, key=key, task=task: self._forget(key, task))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        task, waiters = entry
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            waiters[0] -= 1
+            if waiters[0] == 0 and not task.done():
+                task.cancel()  # Nobody is waiting for the result anymore
+                self.cancelled += 1
+
+    async def stream(self, key: Hashable, open_stream: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """
+        Iterate open_stream() unless an identical stream is already in flight, then share its chunks.
+
+        Args:
+            key: Identity of the call, e.g. ("llm-stream", prompt hash)
+            open_stream: Zero-argument factory for the async iterator
+        """
+        shared = self._streams.get(key)
+        if shared is None or shared.finished:
+            shared = _SharedStream()
+            shared.task = asyncio.ensure_future(self._pump(key, shared, open_stream))
+            self._streams[key] = shared
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        shared.waiters += 1
+        index = 0
+        try:
+            while True:
+                if index < len(shared.chunks):
+                    yield shared.chunks[index]
+                    index += 1
+                elif shared.finished:
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+                else:
+                    await shared.changed.wait()
+        finally:
+            shared.waiters -= 1
+            if shared.waiters == 0 and not shared.finished:
+                shared.task.cancel()  # Nobody is reading the stream anymore
+                self.cancelled += 1
+                self._forget_stream(key, shared)
+
+    async def _pump(self, key: Hashable, shared: _SharedStream, open_stream: Callable[[], AsyncIterator[Any]]):
+        stream = open_stream()
+        try:
+            async for chunk in stream:
+                shared.chunks.append(chunk)
+                shared.notify()
+        except asyncio.CancelledError:
+            shared.error = asyncio.CancelledError()
+        except Exception as e:
+            shared.error = e
+        finally:
+            shared.finished = True
+            shared.notify()
+            self._forget_stream(key, shared)
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await asyncio.gather(aclose(), return_exceptions=True)
+
+    def _forget_stream(self, key: Hashable, shared: _SharedStream):
+        if self._streams.get(key) is shared:
+            del self._streams[key]
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        entry = self._in_flight.get(key)
+        if entry is not None and entry[0] is task:
+            del self._in_flight[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._in_flight) + len(self._streams),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+        }
+
+
+# Shared by web search, query embeddings and LLM calls (keys are namespaced)
+single_flight = SingleFlight()
@@ -0,0 +1,452 @@
+"""
+Pluggable vector store backends for RAG.
+
+- SupabaseVectorStore: pgvector table + match_documents RPC over PostgREST
+- LocalVectorStore: in-process NumPy index per conversation, persisted as
+  memory-mapped .npy files (no network hop, works offline)
+
+Select the backend with VECTOR_STORE_BACKEND=supabase|local.
+"""
+import os
+import re
+import json
+import uuid
+import shutil
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+try:
+    import numpy as np
+except Exception as e:
+    print(f"[VectorStore] Warning: numpy import failed: {e}")
+    np = None
+
+try:
+    import hnswlib
+except Exception:
+    hnswlib = None  # Optional ANN index for large collections
+
+
+class VectorStore:
+    """Interface shared by all vector store backends."""
+
+    name = "base"
+
+    async def add(
+        self,
+        conversation_id: str,
+        document_id: str,
+        chunks: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+    ) -> bool:
+        """Store chunks of one document. All-or-nothing."""
+        raise NotImplementedError
+
+    async def search(
+        self,
+        conversation_id: str,
+        query_embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the top-k chunks as dicts with content, metadata and similarity.
+
+        filter restricts results to rows whose metadata contains all of the
+        given key/value pairs (same semantics as jsonb @> in match_documents).
+        """
+        raise NotImplementedError
+
+    async def delete_document(self, conversation_id: str, document_id: str) -> bool:
+        """Delete all chunks of one document (e.g. to roll back a failed ingestion)."""
+        raise NotImplementedError
+
+    async def clear(self, conversation_id: str) -> bool:
+        """Delete all chunks for a conversation."""
+        raise NotImplementedError
+
+
+class SupabaseVectorStore(VectorStore):
+    """
+    pgvector storage via the Supabase REST API.
+
+    Requests go through the shared Supabase client (app.core.database), so
+    inserts and the per-chat match_documents search reuse pooled connections.
+    """
+
+    name = "supabase"
+
+    # Writes and deletes don't need rows echoed back (they would include the embeddings)
+    _MINIMAL = {"Prefer": "return=minimal"}
+
+    async def add(self, conversation_id, document_id, chunks, embeddings, metadatas) -> bool:
+        """
+        Insert document chunks as JSON arrays over pooled connections.
+
+        PostgREST inserts each array atomically, but a document may span several
+        batches, so a failed batch deletes everything already stored for the
+        document to avoid leaving it half-ingested.
+        """
+        import httpx
+        from app.core.database import supabase
+
+        rows = [
+            {
+                "conversation_id": conversation_id,
+                "content": chunk,
+                "embedding": embedding,
+                "metadata": metadata
+            }
+            for chunk, embedding, metadata in zip(chunks, embeddings, metadatas)
+        ]
+        batch_size = max(1, settings.supabase_insert_batch_size)
+        url = f"{supabase.url}/rest/v1/documents"
+        client = supabase.async_client()
+
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            error = None
+            try:
+                response = await client.post(url, json=batch, headers=self._MINIMAL, timeout=60.0)
+                if response.status_code not in [200, 201]:
+                    error = f"{response.status_code} - {response.text}"
+            except httpx.HTTPError as e:
+                error = str(e)
+
+            if error is None:
+                continue
+
+            print(f"[RAG] Error inserting chunks {start}-{start + len(batch) - 1}: {error}")
+            # Roll back the batches that already landed (a timed-out batch may have too)
+            await self.delete_document(conversation_id, document_id)
+            return False
+
+        print(f"[RAG] Inserted {len(rows)} chunks in {(len(rows) + batch_size - 1) // batch_size} request(s)")
+        return True
+
+    async def search(self, conversation_id, query_embedding, k=4, filter=None) -> List[Dict[str, Any]]:
+        """Call the match_documents RPC function."""
+        from app.core.database import supabase
+
+        response = await supabase.async_client().post(
+            f"{supabase.url}/rest/v1/rpc/match_documents",
+            json={
+                'query_embedding': query_embedding,
+                'match_count': k,
+                'filter': {'conversation_id': conversation_id, **(filter or {})}
+            },
+            timeout=30.0
+        )
+
+        if response.status_code != 200:
+            print(f"[RAG] Error querying documents: {response.status_code} - {response.text}")
+            return []
+        return response.json() or []
+
+    async def delete_document(self, conversation_id, document_id) -> bool:
+        import httpx
+        from app.core.database import supabase
+
+        try:
+            response = await supabase.async_client().delete(
+                f"{supabase.url}/rest/v1/documents",
+                headers=self._MINIMAL,
+                params={
+                    "conversation_id": f"eq.{conversation_id}",
+                    "metadata->>document_id": f"eq.{document_id}"
+                },
+                timeout=30.0
+            )
+        except httpx.HTTPError as e:
+            print(f"[RAG] Deleting document {document_id} failed: {e}")
+            return False
+
+        print(f"[RAG] Deleted document {document_id}: {response.status_code}")
+        return response.status_code in [200, 204]
+
+    async def clear(self, conversation_id) -> bool:
+        from app.core.database import supabase
+
+        response = await supabase.async_client().delete(
+            f"{supabase.url}/rest/v1/documents",
+            headers=self._MINIMAL,
+            params={"conversation_id": f"eq.{conversation_id}"},
+            timeout=30.0
+        )
+
+        if response.status_code in [200, 204]:
+            return True
+        print(f"[RAG] Error clearing documents: {response.status_code}")
+        return False
+
+
+class _LocalCollection:
+    """Vectors and chunk records for one conversation."""
+
+    def __init__(self, vectors, records: List[Dict[str, Any]]):
+        self.vectors = vectors  # (n, dim) float32, L2-normalized, possibly memory-mapped
+        self.records = records  # [{"content": ..., "metadata": ...}]
+        self.ann_index = None
+        self._postings: Optional[Dict[Tuple[str, Any], Any]] = None
+
+    def rows_matching(self, filter: Dict[str, Any]):
+        """
+        Row indices whose metadata contains every filter pair.
+
+        Scalar metadata values are indexed on first use, so a filter costs
+        O(matching rows) rather than a scan over every record.
+        """
+        if self._postings is None:
+            postings: Dict[Tuple[str, Any], List[int]] = {}
+            for row, record in enumerate(self.records):
+                for key, value in (record.get("metadata") or {}).items():
+                    if isinstance(value, (str, int, float, bool)):
+                        postings.setdefault((key, value), []).append(row)
+            self._postings = {pair: np.asarray(rows, dtype=np.int64) for pair, rows in postings.items()}
+
+        rows = None
+        for pair in filter.items():
+            matched = self._postings.get(pair)
+            if matched is None:
+                return np.empty(0, dtype=np.int64)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector index.
+
+    Each conversation is a contiguous float32 matrix of L2-normalized vectors,
+    so cosine top-k is a single matrix-vector product plus argpartition. When
+    hnswlib is installed and a collection exceeds ann_threshold vectors, an
+    HNSW index is built lazily and used instead of brute force.
+
+    Layout on disk: <root>/<conversation>/<generation>/vectors.npy (loaded with
+    mmap_mode="r") and records.jsonl (one chunk per line, same order as the
+    matrix rows). Every write creates a new generation directory and then
+    swaps the CURRENT file naming it, so the two files always change together.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str, ann_threshold: int = 50_000):
+        if np is None:
+            raise RuntimeError("LocalVectorStore requires numpy")
+        self.root = root
+        self.ann_threshold = ann_threshold
+        self._collections: Dict[str, _LocalCollection] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, conversation_id: str) -> str:
+        """Filesystem-safe directory for a conversation."""
+        if re.fullmatch(r"[A-Za-z0-9_-]{1,64}", conversation_id):
+            name = conversation_id
+        else:
+            name = hashlib.sha256(conversation_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, name)
+
+    def _lock(self, conversation_id: str) -> asyncio.Lock:
+        if conversation_id not in self._locks:
+            self._locks[conversation_id] = asyncio.Lock()
+        return self._locks[conversation_id]
+
+    def _load(self, conversation_id: str) -> Optional[_LocalCollection]:
+        """Get a collection from memory, or map it from disk."""
+        collection = self._collections.get(conversation_id)
+        if collection is not None:
+            return collection
+
+        path = self._dir(conversation_id)
+        try:
+            with open(os.path.join(path, "CURRENT"), "r", encoding="utf-8") as f:
+                path = os.path.join(path, f.read().strip())
+        except OSError:
+            pass  # Collections written before generations: files sit in the directory itself
+        vectors_path = os.path.join(path, "vectors.npy")
+        records_path = os.path.join(path, "records.jsonl")
+        if not (os.path.exists(vectors_path) and os.path.exists(records_path)):
+            return None
+
+        vectors = np.load(vectors_path, mmap_mode="r")
+        with open(records_path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        if len(records) != vectors.shape[0]:
+            print(f"[VectorStore] Corrupt local collection {conversation_id}: "
+                  f"{len(records)} records vs {vectors.shape[0]} vectors")
+            return None
+
+        collection = _LocalCollection(vectors, records)
+        self._collections[conversation_id] = collection
+        return collection
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _add_sync(self, conversation_id, chunks, embeddings, metadatas) -> bool:
+        new_vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        new_records = [{"content": c, "metadata": m} for c, m in zip(chunks, metadatas)]
+
+        existing = self._load(conversation_id)
+        if existing is not None and existing.vectors.shape[0]:
+            if existing.vectors.shape[1] != new_vectors.shape[1]:
+                raise ValueError(
+                    f"Embedding dimension mismatch: {existing.vectors.shape[1]} vs {new_vectors.shape[1]}"
+                )
+            vectors = np.concatenate([np.asarray(existing.vectors), new_vectors])
+            records = existing.records + new_records
+        else:
+            vectors, records = new_vectors, new_records
+
+        self._write_sync(conversation_id, vectors, records)
+        return True
+
+    def _write_sync(self, conversation_id, vectors, records):
+        # Write a complete new generation, then swap CURRENT in one rename, so a
+        # crash leaves either the old or the new collection, never a mix
+        path = self._dir(conversation_id)
+        generation = f"gen-{uuid.uuid4().hex}"
+        generation_path = os.path.join(path, generation)
+        os.makedirs(generation_path)
+        vectors_path = os.path.join(generation_path, "vectors.npy")
+        np.save(vectors_path, np.ascontiguousarray(vectors, dtype=np.float32))
+        with open(os.path.join(generation_path, "records.jsonl"), "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        current_tmp = os.path.join(path, "CURRENT.tmp")
+        with open(current_tmp, "w", encoding="utf-8") as f:
+            f.write(generation)
+        os.replace(current_tmp, os.path.join(path, "CURRENT"))
+
+        # Install the new generation before the old one is removed, so no reader
+        # can map (or re-cache) a generation that is about to disappear
+        self._collections[conversation_id] = _LocalCollection(np.load(vectors_path, mmap_mode="r"), records)
+
+        # Old generations (and files from before generations) are no longer referenced
+        for name in os.listdir(path):
+            if name in (generation, "CURRENT"):
+                continue
+            stale = os.path.join(path, name)
+            if os.path.isdir(stale):
+                shutil.rmtree(stale, ignore_errors=True)
+            else:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def _delete_document_sync(self, conversation_id, document_id) -> bool:
+        collection = self._load(conversation_id)
+        if collection is None:
+            return True
+        keep = [
+            row for row, record in enumerate(collection.records)
+            if (record.get("metadata") or {}).get("document_id") != document_id
+        ]
+        if len(keep) == len(collection.records):
+            return True
+        vectors = np.asarray(collection.vectors)[np.asarray(keep, dtype=np.int64)]
+        self._write_sync(conversation_id, vectors, [collection.records[row] for row in keep])
+        return True
+
+    def _build_ann(self, collection: _LocalCollection):
+        index = hnswlib.Index(space="ip", dim=collection.vectors.shape[1])
+        index.init_index(max_elements=collection.vectors.shape[0], ef_construction=200, M=16)
+        index.add_items(np.asarray(collection.vectors))
+        index.set_ef(64)
+        return index
+
+    def _search_sync(self, conversation_id, query_embedding, k, filter=None) -> List[Dict[str, Any]]:
+        collection = self._load(conversation_id)
+        if collection is None or not collection.records:
+            return []
+
+        query = self._normalize(np.asarray(query_embedding, dtype=np.float32))
+
+        if filter:
+            # Brute force over the matching subset only
+            rows = collection.rows_matching(filter)
+            if rows.size == 0:
+                return []
+            similarities = collection.vectors[rows] @ query
+            k = min(k, rows.size)
+            order = np.argpartition(-similarities, k - 1)[:k]
+            order = order[np.argsort(-similarities[order])]
+            top, scores = rows[order], similarities[order]
+        else:
+            n = collection.vectors.shape[0]
+            k = min(k, n)
+            if hnswlib is not None and n >= self.ann_threshold:
+                if collection.ann_index is None:
+                    print(f"[VectorStore] Building HNSW index for {conversation_id} ({n} vectors)")
+                    collection.ann_index = self._build_ann(collection)
+                labels, distances = collection.ann_index.knn_query(query, k=k)
+                top = labels[0]
+                scores = 1.0 - distances[0]  # hnswlib "ip" distance is 1 - dot
+            else:
+                similarities = collection.vectors @ query
+                top = np.argpartition(-similarities, k - 1)[:k]
+                top = top[np.argsort(-similarities[top])]
+                scores = similarities[top]
+
+        return [
+            {
+                "content": collection.records[i]["content"],
+                "metadata": collection.records[i]["metadata"],
+                "similarity": float(score)
+            }
+            for i, score in zip(top, scores)
+        ]
+
+    def _clear_sync(self, conversation_id) -> bool:
+        self._collections.pop(conversation_id, None)
+        shutil.rmtree(self._dir(conversation_id), ignore_errors=True)
+        return True
+
+    async def add(self, conversation_id, document_id, chunks, embeddings, metadatas) -> bool:
+        async with self._lock(conversation_id):
+            return await asyncio.to_thread(self._add_sync, conversation_id, chunks, embeddings, metadatas)
+
+    async def search(self, conversation_id, query_embedding, k=4, filter=None) -> List[Dict[str, Any]]:
+        # Under the lock, so loading and caching a collection can't interleave with a
+        # write swapping CURRENT and deleting the generation being read
+        async with self._lock(conversation_id):
+            return await asyncio.to_thread(self._search_sync, conversation_id, query_embedding, k, filter)
+
+    async def delete_document(self, conversation_id, document_id) -> bool:
+        async with self._lock(conversation_id):
+            return await asyncio.to_thread(self._delete_document_sync, conversation_id, document_id)
+
+    async def clear(self, conversation_id) -> bool:
+        async with self._lock(conversation_id):
+            return await asyncio.to_thread(self._clear_sync, conversation_id)
+
+
+# Global singleton for the configured backend
+_vector_store: Optional[VectorStore] = None
+
+
+def get_vector_store() -> VectorStore:
+    """Get or create the configured vector store backend."""
+    global _vector_store
+    if _vector_store is None:
+        backend = settings.vector_store_backend.lower()
+        if backend == "local":
+            _vector_store = LocalVectorStore(
+                root=settings.local_vector_store_path,
+                ann_threshold=settings.local_vector_store_ann_threshold
+            )
+        else:
+            if backend != "supabase":
+                print(f"[VectorStore] Unknown backend '{backend}', using supabase")
+            _vector_store = SupabaseVectorStore()
+        print(f"[VectorStore] Using {_vector_store.name} backend")
+    return _vector_store
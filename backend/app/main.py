@@ -1,16 +1,44 @@
 """
 FastAPI application entry point for AI Chatbot Platform.
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import auth, chat, conversations, upload
 from app.core.config import settings
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup/shutdown hooks for background workers and pooled clients."""
+    from app.core import rag
+    from app.core.ingestion import ingestion_queue
+    from app.core.document_loader import shutdown_pdf_pool
+    from app.core.direct_tool_executor import direct_executor
+    from app.core.model_router import llm_pool
+    from app.storage.chat_history import chat_history_store
+    from app.core.database import supabase
+    from app.storage.blob_store import blob_store
+    ingestion_queue.start()
+    blob_store.start_sweeper(chat_history_store.blob_ids)
+    yield
+    await blob_store.stop_sweeper()
+    await ingestion_queue.stop()
+    if rag._embedding_model is not None:
+        await rag._embedding_model.aclose()
+    shutdown_pdf_pool()
+    direct_executor.shutdown()
+    await llm_pool.aclose()
+    chat_history_store.close()
+    await supabase.aclose()
+
+
 # Create FastAPI application
 app = FastAPI(
     title=settings.app_name,
     description="FastAPI backend with LangChain for AI chatbot platform",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS for frontend integration
@@ -35,6 +63,33 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime counters for caches and pools."""
+    from app.core import rag
+    from app.core.ingestion import ingestion_queue
+    from app.core.direct_tool_executor import direct_executor
+    from app.core.model_router import llm_pool
+    from app.core.llm_routing import model_health
+    from app.core.response_cache import response_cache
+    from app.core.single_flight import single_flight
+    from app.core.cancellation import cancellation_stats
+    from app.storage.chat_history import chat_history_store
+    from app.storage.blob_store import blob_store
+    return {
+        "embedding_cache": rag._embedding_model.stats() if rag._embedding_model else None,
+        "ingestion": ingestion_queue.stats(),
+        "tools": direct_executor.stats(),
+        "llm_clients": llm_pool.stats(),
+        "llm_routing": model_health.stats(),
+        "response_cache": response_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "cancellation": cancellation_stats.stats(),
+        "chat_history": chat_history_store.stats(),
+        "blobs": blob_store.stats(),
+    }
+
+
 @app.get("/")
 async def root():
     """Root endpoint with API information."""
@@ -25,3 +25,4 @@ class ChatResponse(BaseModel):
     images: List[str] = []
     image_url: Optional[str] = None  # Generated image URL
     tools_used: List[str] = []  # Tools that were used
+    context_tokens: int = 0  # Tokens of retrieved context sent to the LLM
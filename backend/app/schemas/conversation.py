@@ -25,3 +25,26 @@ class Conversation(BaseModel):
 class ConversationList(BaseModel):
     """List of conversations."""
     conversations: List[Conversation]
+
+
+class ConversationSummary(BaseModel):
+    """Conversation listing entry (no messages)."""
+    conversation_id: str
+    title: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    message_count: int
+    last_message: Optional[str] = None  # Snippet of the latest message
+
+
+class ConversationPage(BaseModel):
+    """One page of conversations, most recently updated first."""
+    conversations: List[ConversationSummary]
+    next_cursor: Optional[str] = None  # Pass as ?cursor= for the next page; None on the last page
+
+
+class MessagePage(BaseModel):
+    """One page of a conversation's messages, in chronological order."""
+    conversation_id: str
+    messages: List[Message]
+    next_cursor: Optional[str] = None  # Pass as ?cursor= for older messages; None at the start
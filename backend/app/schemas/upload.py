@@ -0,0 +1,22 @@
+"""
+Upload schemas for ingestion job status responses.
+"""
+from pydantic import BaseModel
+from typing import Dict, Optional
+from datetime import datetime
+
+
+class IngestionJobStatus(BaseModel):
+    """Progress of a background document ingestion job."""
+    job_id: str
+    conversation_id: str
+    filename: str
+    size_bytes: int
+    status: str  # queued | running | completed | failed | cancelled
+    stage: str  # queued | extracting | embedding | storing | done
+    progress: Dict[str, int] = {}  # pages, chunks, embedded, stored
+    text_length: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
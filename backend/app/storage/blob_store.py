@@ -0,0 +1,247 @@
+"""
+Content-addressed storage for uploaded binary files (images).
+
+Blobs are stored as raw bytes under <root>/<sha256[:2]>/<sha256>, so the
+same upload is written once no matter how many conversations reference it.
+Reads go through a read-only memory map; base64 and data URLs are produced
+only where a provider or the browser needs them.
+
+Retention: uploading or reading a blob refreshes its mtime. A periodic sweep
+deletes blobs that no conversation references and that nobody has used for
+BLOB_RETENTION_HOURS. Chat history lives in each worker's memory, so a
+worker can't see the blobs another one references: every sweeper registers
+under <root>/.workers, and a sweep only runs while its worker is the only
+one alive.
+"""
+import os
+import time
+import mmap
+import asyncio
+import base64
+import hashlib
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Optional, Set
+from app.core.config import settings
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists but belongs to someone else
+    return True
+
+
+class BlobStore:
+    """Deduplicating on-disk blob store keyed by SHA-256."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.dedup_hits = 0
+        self.bytes_written = 0
+        self.swept = 0
+        self.bytes_swept = 0
+        self._sweeper: Optional[asyncio.Task] = None
+        self._worker_file = None
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, blob_id: str) -> str:
+        if len(blob_id) != 64 or any(c not in "0123456789abcdef" for c in blob_id):
+            raise ValueError(f"Invalid blob id: {blob_id!r}")
+        return os.path.join(self.root, blob_id[:2], blob_id)
+
+    def put(self, data: bytes) -> str:
+        """
+        Store bytes (no-op if identical content is already stored).
+
+        Returns:
+            Blob id (hex SHA-256 of the content)
+        """
+        blob_id = hashlib.sha256(data).hexdigest()
+        path = self._path(blob_id)
+        # Touch and existence check in one step: a blob a sweep removes first is written again
+        try:
+            os.utime(path)
+            with self._lock:
+                self.dedup_hits += 1
+            return blob_id
+        except FileNotFoundError:
+            pass
+
+        # Write to a temp file and rename, so readers never see a partial blob
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self.writes += 1
+            self.bytes_written += len(data)
+        return blob_id
+
+    def open(self, blob_id: str) -> mmap.mmap:
+        """Map a blob read-only (close it, or use it as a context manager)."""
+        with open(self._path(blob_id), "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def size(self, blob_id: str) -> int:
+        return os.path.getsize(self._path(blob_id))
+
+    @staticmethod
+    def _touch(path: str):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def base64(self, blob_id: str) -> str:
+        """Base64 of a blob, encoded straight from the mapping."""
+        self._touch(self._path(blob_id))
+        if self.size(blob_id) == 0:
+            return ""  # Empty files can't be mapped
+        with self.open(blob_id) as data:
+            return base64.b64encode(data).decode("ascii")
+
+    def data_url(self, blob_id: str, mime_type: str) -> str:
+        return f"data:{mime_type};base64,{self.base64(blob_id)}"
+
+    def sweep(self, live: Set[str], max_age_seconds: float) -> int:
+        """
+        Delete blobs not in live that were last used more than max_age_seconds ago.
+
+        Args:
+            live: Blob ids still referenced by conversations
+            max_age_seconds: Retention window for unreferenced blobs
+
+        Returns:
+            Number of files removed (abandoned temp files included)
+        """
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for directory, subdirectories, names in os.walk(self.root):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith(".")]
+            for name in names:
+                if name in live:
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime >= cutoff:
+                        continue
+                    if not name.startswith("."):
+                        # Move the blob aside before the final check, so a put that touched it
+                        # in the meantime is seen here, and a later one finds it gone and rewrites it
+                        swept_path = os.path.join(directory, f".sweep-{name}")
+                        os.replace(path, swept_path)
+                        if os.stat(swept_path).st_mtime >= cutoff:
+                            os.replace(swept_path, path)
+                            continue
+                        path = swept_path
+                    os.remove(path)
+                except OSError:
+                    continue
+                removed += 1
+                with self._lock:
+                    self.swept += 1
+                    self.bytes_swept += stat.st_size
+        if removed:
+            print(f"[BlobStore] Swept {removed} unused blobs")
+        return removed
+
+    def _workers_dir(self) -> str:
+        return os.path.join(self.root, ".workers")
+
+    def _register_worker(self):
+        # Kept open while the worker runs: Windows refuses to delete an open file
+        os.makedirs(self._workers_dir(), exist_ok=True)
+        self._worker_file = open(os.path.join(self._workers_dir(), str(os.getpid())), "w")
+
+    def _unregister_worker(self):
+        if self._worker_file is None:
+            return
+        self._worker_file.close()
+        self._worker_file = None
+        try:
+            os.remove(os.path.join(self._workers_dir(), str(os.getpid())))
+        except OSError:
+            pass
+
+    def _other_workers(self) -> int:
+        """Count other live workers, removing the registrations of dead ones."""
+        try:
+            names = os.listdir(self._workers_dir())
+        except OSError:
+            return 0
+        alive = 0
+        for name in names:
+            if not name.isdigit() or int(name) == os.getpid():
+                continue
+            if os.name != "nt" and _process_alive(int(name)):
+                alive += 1
+                continue
+            try:
+                os.remove(os.path.join(self._workers_dir(), name))
+            except OSError:
+                alive += 1  # Still open by its worker (Windows)
+        return alive
+
+    def _sweep_if_sole_worker(self, live_blob_ids: Callable[[], Set[str]]) -> int:
+        others = self._other_workers()
+        if others:
+            print(f"[BlobStore] Skipping sweep: {others} other worker(s) may reference blobs")
+            return 0
+        return self.sweep(live_blob_ids(), settings.blob_retention_hours * 3600)
+
+    def start_sweeper(self, live_blob_ids: Callable[[], Set[str]]):
+        """
+        Sweep periodically on the running event loop (idempotent).
+
+        The reference scan and the sweep run in a worker thread, and only while
+        no other worker process is registered.
+        """
+        if self._sweeper is not None:
+            return
+        self._register_worker()
+
+        async def run():
+            while True:
+                try:
+                    await asyncio.to_thread(self._sweep_if_sole_worker, live_blob_ids)
+                except Exception as e:
+                    print(f"[BlobStore] Sweep failed: {e}")
+                await asyncio.sleep(settings.blob_sweep_interval_seconds)
+
+        self._sweeper = asyncio.create_task(run(), name="blob-sweeper")
+
+    async def stop_sweeper(self):
+        if self._sweeper is None:
+            return
+        self._sweeper.cancel()
+        await asyncio.gather(self._sweeper, return_exceptions=True)
+        self._sweeper = None
+        self._unregister_worker()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "writes": self.writes,
+            "dedup_hits": self.dedup_hits,
+            "bytes_written": self.bytes_written,
+            "swept": self.swept,
+            "bytes_swept": self.bytes_swept,
+        }
+
+
+# Global blob store
+blob_store = BlobStore(settings.blob_store_path)
@@ -1,72 +1,389 @@
 """
-In-memory chat history storage.
+Bounded chat history storage.
+
+Conversations (messages and references to uploaded images, whose bytes live
+in the blob store) are kept in two tiers:
+- an in-process LRU of hot conversations, limited by count and by size
+- a local SQLite spill file for conversations evicted from memory
+
+Evicted conversations are loaded back transparently on their next access.
+A small summary of every conversation, ordered by updated_at, stays in
+memory so listings cost O(page) and never touch message bodies.
+The spill file belongs to one worker process, is created on the first
+eviction and removed on shutdown, so the store keeps the lifetime of the
+previous in-memory version; durable history lives in Supabase. Files left by
+workers that died without shutting down are swept when the next store starts.
 """
-from typing import Dict, List
+import os
+import re
+import json
+import bisect
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
 from datetime import datetime
-from app.schemas.conversation import Conversation, Message
+from app.core.config import settings
+from app.schemas.conversation import Conversation, ConversationSummary, Message
+
+# Rough per-object overhead added to content lengths when sizing entries
+_MESSAGE_OVERHEAD_BYTES = 200
+_IMAGE_OVERHEAD_BYTES = 200
+
+# Characters of the latest message kept in a conversation summary
+_SNIPPET_CHARS = 120
+
+_SPILL_FILE_RE = re.compile(r"spill-(\d+)\.sqlite3(-wal|-shm)?$")
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists but belongs to someone else
+    return True
+
+
+def _sweep_stale_spills(directory: str):
+    """Remove spill files of worker processes that are no longer running."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        match = _SPILL_FILE_RE.match(name)
+        if match is None or int(match.group(1)) == os.getpid():
+            continue
+        # Windows refuses to delete a file a live worker has open, so no liveness check is needed there
+        if os.name != "nt" and _process_alive(int(match.group(1))):
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+            print(f"[ChatHistory] Removed stale spill file {name}")
+        except OSError:
+            pass
+
+
+class _Entry:
+    """A conversation in the memory tier."""
+
+    def __init__(self, conversation: Conversation, images: List[Dict]):
+        self.conversation = conversation
+        self.images = images
+        self.size = (
+            sum(len(m.content) + _MESSAGE_OVERHEAD_BYTES for m in conversation.messages)
+            + len(images) * _IMAGE_OVERHEAD_BYTES
+        )
 
 
 class ChatHistoryStore:
-    """In-memory storage for chat conversations."""
-    
-    def __init__(self):
-        self._conversations: Dict[str, Conversation] = {}
-        self._conversation_images: Dict[str, List[Dict]] = {}  # Store images per conversation
-    
+    """Two-tier (LRU memory + SQLite spill) storage for chat conversations."""
+
+    def __init__(self, max_conversations: int = 500, max_memory_bytes: int = 256 * 1024 * 1024,
+                 spill_path: Optional[str] = None):
+        self.max_conversations = max_conversations
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_path = spill_path
+        self._memory: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        # Summary index over both tiers: id -> summary, plus (updated_at, id) keys in ascending order
+        self._summaries: Dict[str, ConversationSummary] = {}
+        self._by_updated: List[Tuple[datetime, str]] = []
+
+        self.memory_hits = 0
+        self.disk_loads = 0
+        self.evictions = 0
+        self.dropped = 0  # Evicted with no spill tier (lost)
+
+        if spill_path:
+            _sweep_stale_spills(os.path.dirname(os.path.abspath(spill_path)))
+
+    def _open_spill(self) -> Optional[sqlite3.Connection]:
+        """Open the spill file on first use, so processes that never evict leave no file behind."""
+        if self._db is None and self.spill_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+                self._db = sqlite3.connect(self.spill_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS conversations ("
+                    "conversation_id TEXT PRIMARY KEY, conversation TEXT NOT NULL, images TEXT NOT NULL)"
+                )
+                self._db.execute("DELETE FROM conversations")  # Leftovers from a crashed worker with our pid
+                self._db.commit()
+            except Exception as e:
+                print(f"[ChatHistory] Spill tier disabled ({self.spill_path}): {e}")
+                self._db = None
+                self.spill_path = None
+        return self._db
+
+    # Summary index
+
+    def _index(self, conversation: Conversation):
+        """Insert or refresh a conversation's summary and its position in the updated_at order."""
+        previous = self._summaries.get(conversation.conversation_id)
+        if previous is not None:
+            key = (previous.updated_at, previous.conversation_id)
+            position = bisect.bisect_left(self._by_updated, key)
+            if position < len(self._by_updated) and self._by_updated[position] == key:
+                del self._by_updated[position]
+
+        last = conversation.messages[-1].content if conversation.messages else None
+        summary = ConversationSummary(
+            conversation_id=conversation.conversation_id,
+            title=conversation.title,
+            created_at=conversation.created_at,
+            updated_at=conversation.updated_at,
+            message_count=len(conversation.messages),
+            last_message=last[:_SNIPPET_CHARS] if last is not None else None
+        )
+        self._summaries[conversation.conversation_id] = summary
+        bisect.insort(self._by_updated, (summary.updated_at, summary.conversation_id))
+
+    def _unindex(self, conversation_id: str):
+        summary = self._summaries.pop(conversation_id, None)
+        if summary is not None:
+            key = (summary.updated_at, conversation_id)
+            position = bisect.bisect_left(self._by_updated, key)
+            if position < len(self._by_updated) and self._by_updated[position] == key:
+                del self._by_updated[position]
+
+    # Tiering
+
+    def _spill(self, conversation_id: str, entry: _Entry):
+        if self._open_spill() is None:
+            self.dropped += 1
+            self._unindex(conversation_id)
+            print(f"[ChatHistory] Dropped conversation {conversation_id} (no spill tier)")
+            return
+        images = [{**image, 'uploaded_at': image['uploaded_at'].isoformat()} for image in entry.images]
+        self._db.execute(
+            "INSERT OR REPLACE INTO conversations (conversation_id, conversation, images) VALUES (?, ?, ?)",
+            (conversation_id, entry.conversation.model_dump_json(), json.dumps(images))
+        )
+        self._db.commit()
+
+    @staticmethod
+    def _parse_row(conversation_json: str, images_json: str) -> _Entry:
+        images = json.loads(images_json)
+        for image in images:
+            image['uploaded_at'] = datetime.fromisoformat(image['uploaded_at'])
+        return _Entry(Conversation.model_validate_json(conversation_json), images)
+
+    def _evict(self):
+        """Spill least recently used conversations until both limits hold (the newest always stays)."""
+        while len(self._memory) > 1 and (
+            len(self._memory) > self.max_conversations or self._memory_bytes > self.max_memory_bytes
+        ):
+            conversation_id, entry = self._memory.popitem(last=False)
+            self._memory_bytes -= entry.size
+            self.evictions += 1
+            try:
+                self._spill(conversation_id, entry)
+            except Exception as e:
+                self.dropped += 1
+                self._unindex(conversation_id)
+                print(f"[ChatHistory] Error spilling conversation {conversation_id}: {e}")
+
+    def _admit(self, conversation_id: str, entry: _Entry):
+        self._memory[conversation_id] = entry
+        self._memory_bytes += entry.size
+        self._evict()
+
+    def _resize(self, entry: _Entry, added_bytes: int):
+        entry.size += added_bytes
+        self._memory_bytes += added_bytes
+        self._evict()
+
+    def _entry(self, conversation_id: str, create: bool) -> Optional[_Entry]:
+        """Find a conversation in memory, then in the spill file (moving it back to memory)."""
+        entry = self._memory.get(conversation_id)
+        if entry is not None:
+            self._memory.move_to_end(conversation_id)
+            self.memory_hits += 1
+            return entry
+
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT conversation, images FROM conversations WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+            if row is not None:
+                entry = self._parse_row(*row)
+                self._db.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
+                self._db.commit()
+                self.disk_loads += 1
+                self._admit(conversation_id, entry)
+                return entry
+
+        if not create:
+            return None
+        now = datetime.utcnow()
+        entry = _Entry(Conversation(
+            conversation_id=conversation_id,
+            title=f"Conversation {conversation_id[:8]}",
+            messages=[],
+            created_at=now,
+            updated_at=now
+        ), [])
+        self._admit(conversation_id, entry)
+        self._index(entry.conversation)
+        return entry
+
+    # Public API
+
     def get_conversation(self, conversation_id: str) -> Conversation:
         """Get or create a conversation."""
-        if conversation_id not in self._conversations:
-            now = datetime.utcnow()
-            self._conversations[conversation_id] = Conversation(
-                conversation_id=conversation_id,
-                title=f"Conversation {conversation_id[:8]}",
-                messages=[],
-                created_at=now,
-                updated_at=now
-            )
-        return self._conversations[conversation_id]
-    
+        with self._lock:
+            return self._entry(conversation_id, create=True).conversation
+
     def add_message(self, conversation_id: str, role: str, content: str):
         """Add a message to a conversation."""
-        conversation = self.get_conversation(conversation_id)
-        message = Message(
-            role=role,
-            content=content,
-            timestamp=datetime.utcnow()
-        )
-        conversation.messages.append(message)
-        conversation.updated_at = datetime.utcnow()
-    
+        with self._lock:
+            entry = self._entry(conversation_id, create=True)
+            message = Message(
+                role=role,
+                content=content,
+                timestamp=datetime.utcnow()
+            )
+            entry.conversation.messages.append(message)
+            entry.conversation.updated_at = datetime.utcnow()
+            self._index(entry.conversation)
+            self._resize(entry, len(content) + _MESSAGE_OVERHEAD_BYTES)
+
     def get_all_conversations(self) -> List[Conversation]:
-        """Get all conversations."""
-        return list(self._conversations.values())
-    
+        """Get all conversations (spilled ones are read without being moved back to memory)."""
+        with self._lock:
+            conversations = [entry.conversation for entry in self._memory.values()]
+            if self._db is not None:
+                rows = self._db.execute("SELECT conversation FROM conversations").fetchall()
+                conversations.extend(Conversation.model_validate_json(row[0]) for row in rows)
+            return conversations
+
+    def list_conversations(self, limit: int, before: Optional[Tuple[datetime, str]] = None) -> List[ConversationSummary]:
+        """
+        Conversation summaries, most recently updated first.
+
+        Args:
+            limit: Maximum number of summaries
+            before: (updated_at, conversation_id) of the last summary of the previous page
+
+        Returns:
+            Up to limit summaries ordered after `before`
+        """
+        with self._lock:
+            end = len(self._by_updated) if before is None else bisect.bisect_left(self._by_updated, before)
+            keys = self._by_updated[max(0, end - limit):end]
+            return [self._summaries[conversation_id] for _, conversation_id in reversed(keys)]
+
+    def get_message_page(self, conversation_id: str, limit: int,
+                         before: Optional[int] = None) -> Optional[Tuple[List[Message], int]]:
+        """
+        A slice of a conversation's messages, ending before index `before` (newest page by default).
+
+        Returns:
+            (messages in chronological order, index of the first one), or None if the conversation doesn't exist
+        """
+        with self._lock:
+            entry = self._entry(conversation_id, create=False)
+            if entry is None:
+                return None
+            messages = entry.conversation.messages
+            end = len(messages) if before is None else max(0, min(before, len(messages)))
+            start = max(0, end - limit)
+            return messages[start:end], start
+
     def get_messages(self, conversation_id: str) -> List[Message]:
         """Get all messages for a conversation."""
-        conversation = self.get_conversation(conversation_id)
-        return conversation.messages
-    
-    def add_image(self, conversation_id: str, image_base64: str, filename: str, image_format: str):
-        """Add an image to a conversation."""
-        if conversation_id not in self._conversation_images:
-            self._conversation_images[conversation_id] = []
-        
-        self._conversation_images[conversation_id].append({
-            'base64': image_base64,
-            'filename': filename,
-            'format': image_format,
-            'uploaded_at': datetime.utcnow()
-        })
+        return self.get_conversation(conversation_id).messages
+
+    def add_image(self, conversation_id: str, blob_id: str, filename: str, image_format: str, size: int):
+        """
+        Add an image to a conversation.
+
+        Args:
+            conversation_id: Conversation to attach the image to
+            blob_id: Blob store id of the raw image bytes
+            filename: Original filename
+            image_format: Extension without the dot (png, jpg, ...)
+            size: Image size in bytes
+        """
+        with self._lock:
+            entry = self._entry(conversation_id, create=True)
+            entry.images.append({
+                'blob_id': blob_id,
+                'filename': filename,
+                'format': image_format,
+                'size': size,
+                'uploaded_at': datetime.utcnow()
+            })
+            self._resize(entry, _IMAGE_OVERHEAD_BYTES)
         print(f"[ChatHistory] Added image {filename} to conversation {conversation_id}")
-    
+
     def get_conversation_images(self, conversation_id: str) -> List[Dict]:
-        """Get all images for a conversation."""
-        return self._conversation_images.get(conversation_id, [])
-    
+        """Get all images (metadata plus blob_id) for a conversation."""
+        with self._lock:
+            entry = self._entry(conversation_id, create=False)
+            return entry.images if entry is not None else []
+
+    def blob_ids(self) -> Set[str]:
+        """Blob ids referenced by any conversation in either tier."""
+        with self._lock:
+            ids = {image['blob_id'] for entry in self._memory.values() for image in entry.images}
+            if self._db is not None:
+                for (images_json,) in self._db.execute("SELECT images FROM conversations"):
+                    ids.update(image['blob_id'] for image in json.loads(images_json))
+            return ids
+
     def has_images(self, conversation_id: str) -> bool:
         """Check if conversation has images."""
-        return conversation_id in self._conversation_images and len(self._conversation_images[conversation_id]) > 0
+        return len(self.get_conversation_images(conversation_id)) > 0
+
+    def close(self):
+        """Remove the spill file (call on application shutdown)."""
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.close()
+            self._db = None
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(self.spill_path + suffix)
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Tier sizes and eviction counters."""
+        with self._lock:
+            spilled = 0
+            if self._db is not None:
+                spilled = self._db.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+            return {
+                "memory_conversations": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "max_memory_bytes": self.max_memory_bytes,
+                "spilled_conversations": spilled,
+                "memory_hits": self.memory_hits,
+                "disk_loads": self.disk_loads,
+                "evictions": self.evictions,
+                "dropped": self.dropped,
+            }
+
+
+def _spill_path() -> Optional[str]:
+    # One spill file per worker process
+    if not settings.chat_history_spill_dir:
+        return None
+    return os.path.join(settings.chat_history_spill_dir, f"spill-{os.getpid()}.sqlite3")
 
 
 # Global chat history store instance
-chat_history_store = ChatHistoryStore()
+chat_history_store = ChatHistoryStore(
+    max_conversations=settings.chat_history_max_conversations,
+    max_memory_bytes=settings.chat_history_max_memory_mb * 1024 * 1024,
+    spill_path=_spill_path()
+)
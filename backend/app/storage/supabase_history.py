@@ -1,7 +1,11 @@
 """
 Supabase-backed chat message history for LangChain.
+
+The async methods (aget_messages, aadd_messages, aclear) use the pooled
+async client; the sync ones are for callers outside the event loop.
 """
-from typing import List, Optional
+from collections import OrderedDict
+from typing import List, Sequence
 try:
     from langchain_core.chat_history import BaseChatMessageHistory
     from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
@@ -13,54 +17,86 @@ except Exception as e:
     AIMessage = object
 from app.core.database import supabase
 
+# Conversations this process has already seen or created (bounded)
+_known_conversations: "OrderedDict[str, None]" = OrderedDict()
+_MAX_KNOWN_CONVERSATIONS = 10_000
+
+
+def _remember_conversation(conversation_id: str) -> None:
+    _known_conversations[conversation_id] = None
+    _known_conversations.move_to_end(conversation_id)
+    while len(_known_conversations) > _MAX_KNOWN_CONVERSATIONS:
+        _known_conversations.popitem(last=False)
+
+
+def _to_messages(rows: List[dict]) -> List[BaseMessage]:
+    # Note: API might not support order by in lightweight client easily, sorting in python
+    messages = []
+    for msg in sorted(rows, key=lambda x: x.get('created_at') or ''):
+        content = msg.get("content", "")
+        role = msg.get("role", "")
+
+        if role == "user":
+            messages.append(HumanMessage(content=content))
+        elif role == "assistant":
+            messages.append(AIMessage(content=content))
+    return messages
+
 
 class SupabaseChatMessageHistory(BaseChatMessageHistory):
     """
     Chat message history that stores messages in Supabase.
     """
-    
+
     def __init__(self, conversation_id: str, user_id: str):
         self.conversation_id = conversation_id
         self.user_id = user_id
-        
-        # Ensure conversation exists
-        try:
-            # Check if conversation exists
-            existing = supabase.table("conversations").select("id").eq("id", conversation_id).execute()
-            
-            if not existing.data:
-                # Create conversation
-                supabase.table("conversations").insert({
-                    "id": conversation_id,
-                    "user_id": user_id,
-                    "title": f"Conversation {conversation_id[:8]}"
-                })
-        except Exception as e:
-            print(f"Error initializing conversation history: {e}")
+
+    def _conversation_row(self) -> dict:
+        return {
+            "id": self.conversation_id,
+            "user_id": self.user_id,
+            "title": f"Conversation {self.conversation_id[:8]}"
+        }
+
+    def _message_row(self, message: BaseMessage) -> dict:
+        return {
+            "conversation_id": self.conversation_id,
+            "role": "user" if isinstance(message, HumanMessage) else "assistant",
+            "content": message.content
+        }
+
+    def _ensure_conversation(self) -> None:
+        if self.conversation_id in _known_conversations:
+            return
+        existing = supabase.table("conversations").select("id").eq("id", self.conversation_id).execute()
+        if not existing.data:
+            supabase.table("conversations").insert(self._conversation_row())
+        _remember_conversation(self.conversation_id)
+
+    async def _aensure_conversation(self) -> None:
+        if self.conversation_id in _known_conversations:
+            return
+        existing = await supabase.table("conversations").select("id").eq("id", self.conversation_id).aexecute()
+        if not existing.data:
+            await supabase.table("conversations").ainsert(self._conversation_row())
+        _remember_conversation(self.conversation_id)
 
     @property
     def messages(self) -> List[BaseMessage]:
         """Retrieve messages from Supabase."""
         try:
-            response = supabase.table("messages") \
-                .select("*") \
-                .eq("conversation_id", self.conversation_id) \
-                .execute()  # Note: API might not support order by in lightweight client easily, sorting in python
-            
-            # Sort by created_at
-            stored_messages = sorted(response.data, key=lambda x: x.get('created_at', ''))
-            
-            messages = []
-            for msg in stored_messages:
-                content = msg.get("content", "")
-                role = msg.get("role", "")
-                
-                if role == "user":
-                    messages.append(HumanMessage(content=content))
-                elif role == "assistant":
-                    messages.append(AIMessage(content=content))
-            
-            return messages
+            response = supabase.table("messages").select("*").eq("conversation_id", self.conversation_id).execute()
+            return _to_messages(response.data)
+        except Exception as e:
+            print(f"Error retrieving messages: {e}")
+            return []
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        """Retrieve messages from Supabase without blocking the event loop."""
+        try:
+            response = await supabase.table("messages").select("*").eq("conversation_id", self.conversation_id).aexecute()
+            return _to_messages(response.data)
         except Exception as e:
             print(f"Error retrieving messages: {e}")
             return []
@@ -68,22 +104,34 @@ class SupabaseChatMessageHistory(BaseChatMessageHistory):
     def add_message(self, message: BaseMessage) -> None:
         """Add a message to the history."""
         try:
-            role = "user" if isinstance(message, HumanMessage) else "assistant"
-            
-            supabase.table("messages").insert({
-                "conversation_id": self.conversation_id,
-                "role": role,
-                "content": message.content
-            })
-            
+            self._ensure_conversation()
+            supabase.table("messages").insert(self._message_row(message))
+
             # Update conversation updated_at
             # Note: Lightweight client doesn't support PATCH easily yet, skipping for now
         except Exception as e:
             print(f"Error adding message: {e}")
 
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """Add messages to the history in one insert."""
+        if not messages:
+            return
+        try:
+            await self._aensure_conversation()
+            await supabase.table("messages").ainsert([self._message_row(message) for message in messages])
+        except Exception as e:
+            print(f"Error adding messages: {e}")
+
     def clear(self) -> None:
         """Clear session memory from Supabase."""
         try:
             supabase.table("messages").eq("conversation_id", self.conversation_id).delete()
         except Exception as e:
             print(f"Error clearing history: {e}")
+
+    async def aclear(self) -> None:
+        """Clear session memory from Supabase without blocking the event loop."""
+        try:
+            await supabase.table("messages").eq("conversation_id", self.conversation_id).adelete()
+        except Exception as e:
+            print(f"Error clearing history: {e}")
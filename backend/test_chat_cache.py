@@ -0,0 +1,85 @@
+"""
+Test that the response cache only serves direct answers, never tool-route turns
+"""
+import asyncio
+
+import app.api.chat as chat
+from app.core.config import settings
+from app.core.request_router import ROUTE_PLAN
+from app.schemas.chat import ChatRequest
+
+
+class RecordingCache:
+    """Stands in for the response cache and records every lookup and store."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def aget(self, model, scope, message, context_text):
+        self.calls.append("aget")
+        return {"message": "cached answer"}
+
+    async def aput(self, model, scope, message, context_text, response):
+        self.calls.append("aput")
+
+
+async def _gather_context(conversation_id, message, **kwargs):
+    return {"sources": [], "image_url": None, "snippets": []}
+
+
+async def _aload_tools(enabled_mcps):
+    return []
+
+
+async def _tool_events(model, llm, tools, history_messages, message, chat_prompt):
+    yield "token", {"text": "fresh answer from the tools"}
+
+
+async def _answer_events(llm, chat_prompt):
+    yield "token", {"text": "fresh answer"}
+
+
+def _run(message, enabled_mcps):
+    cache = RecordingCache()
+    chat.response_cache = cache
+    chat.gather_context = _gather_context
+    chat.get_llm = lambda model: None
+    chat.aload_tools = _aload_tools
+    chat.tool_events = _tool_events
+    chat._answer_events = _answer_events
+    settings.response_cache_enabled = True
+    settings.chat_fast_path = True
+
+    request = ChatRequest(
+        conversation_id="cache-test",
+        model="test-model",
+        enabled_mcps=enabled_mcps,
+        enabled_tools={},
+        use_rag=False,
+        message=message
+    )
+
+    async def collect():
+        return [event async for event in chat._chat_events(request)]
+
+    return cache.calls, asyncio.run(collect())
+
+
+def test_tool_route_bypasses_cache():
+    calls, events = _run("Any unread email from Alice?", ["gmail"])
+    assert ("route", {"route": ROUTE_PLAN, "reason": "tool intent for gmail"}) in events, events
+    assert calls == [], calls
+    assert ("token", {"text": "fresh answer from the tools"}) in events, events
+    print("✓ Tool-route request bypasses the response cache")
+
+
+def test_direct_answer_uses_cache():
+    calls, events = _run("What is the capital of France?", [])
+    assert calls == ["aget"], calls
+    assert ("cache", {"hit": True}) in events, events
+    print("✓ Direct answer is served from the response cache")
+
+
+if __name__ == "__main__":
+    test_tool_route_bypasses_cache()
+    test_direct_answer_uses_cache()
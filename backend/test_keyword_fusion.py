@@ -0,0 +1,31 @@
+"""
+Test reciprocal rank fusion of vector and keyword results
+"""
+from app.core.keyword_index import reciprocal_rank_fusion
+
+
+def test_legacy_chunks_without_document_id():
+    # Two legacy documents: chunk_index but no document_id, both starting at 0
+    vector_results = [
+        {"content": "leave policy", "metadata": {"chunk_index": 0}, "similarity": 0.9},
+        {"content": "travel policy", "metadata": {"chunk_index": 0}, "similarity": 0.8},
+    ]
+    keyword_results = [
+        {"content": "travel policy", "metadata": {"chunk_index": 0}, "bm25": 3.2},
+    ]
+    fused = reciprocal_rank_fusion([vector_results, keyword_results])
+    assert [doc["content"] for doc in fused] == ["travel policy", "leave policy"], fused
+    print("✓ Legacy chunks from different documents are kept apart")
+
+
+def test_chunks_with_document_id():
+    vector_results = [{"content": "a", "metadata": {"document_id": "d1", "chunk_index": 0}, "similarity": 0.7}]
+    keyword_results = [{"content": "a", "metadata": {"document_id": "d1", "chunk_index": 0}, "bm25": 1.5}]
+    fused = reciprocal_rank_fusion([vector_results, keyword_results])
+    assert len(fused) == 1 and fused[0]["similarity"] == 0.7 and fused[0]["bm25"] == 1.5, fused
+    print("✓ The same chunk from both lists is fused")
+
+
+if __name__ == "__main__":
+    test_legacy_chunks_without_document_id()
+    test_chunks_with_document_id()